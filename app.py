@@ -8,6 +8,10 @@ from io import StringIO
 from datetime import datetime, timedelta
 from genrunzS1 import main_pipeline
 from strava_connector import StravaConnector, get_strava_auth_url, exchange_code_for_token
+from strava_store import ActivityStore
+
+# Activités Strava conservées d'une génération à l'autre
+STRAVA_DATA_DIR = os.environ.get("STRAVA_DATA_DIR", "strava_data")
 
 # Configuration de la page
 st.set_page_config(
@@ -234,6 +238,13 @@ with st.sidebar:
                 help="Limite le nombre d'activités téléchargées"
             )
             
+            preview_mode = st.checkbox(
+                "👀 Aperçu rapide",
+                value=False,
+                help="Tracés simplifiés de Strava, sans télécharger les streams GPS : "
+                     "rendu basse fidélité quasi immédiat"
+            )
+            
             folder = None  # Sera créé temporairement
     
     else:  # Dossier local
@@ -294,8 +305,9 @@ with col2:
 if generate_button:
     # Créer dossier temporaire
     with tempfile.TemporaryDirectory() as temp_dir:
+        files = None
         
-        # Si source = Strava, télécharger les activités
+        # Si source = Strava, synchroniser les activités
         if data_source == "🏃 Strava API":
             st.info("📥 Téléchargement des activités depuis Strava...")
             
@@ -308,28 +320,34 @@ if generate_button:
                 
                 # Récupérer infos athlète
                 athlete = connector.get_athlete_info()
+                # Le refresh token a pu être renouvelé par Strava
+                st.session_state['strava_refresh_token'] = connector.refresh_token
                 st.success(f"✅ Connecté: {athlete['firstname']} {athlete['lastname']}")
                 
-                # Télécharger activités
-                strava_folder = os.path.join(temp_dir, "strava_activities")
+                # Synchroniser le stockage local : seules les nouvelles
+                # activités et les streams manquants sont téléchargés
+                store = ActivityStore(STRAVA_DATA_DIR, athlete['id'])
                 
                 after_date = datetime.combine(date_range[0], datetime.min.time()) if len(date_range) > 0 else None
                 before_date = datetime.combine(date_range[1], datetime.max.time()) if len(date_range) > 1 else None
                 
-                downloaded_files = connector.download_activities(
-                    output_folder=strava_folder,
-                    after=after_date,
-                    before=before_date,
-                    activity_types=activity_types,
-                    max_activities=max_activities
-                )
+                with store:
+                    downloaded_files = connector.sync_activities(
+                        store,
+                        after=after_date,
+                        before=before_date,
+                        activity_types=activity_types,
+                        max_activities=max_activities,
+                        preview=preview_mode
+                    )
                 
                 if not downloaded_files:
                     st.error("❌ Aucune activité téléchargée")
                     st.stop()
                 
-                st.success(f"✅ {len(downloaded_files)} activités téléchargées")
-                folder = strava_folder
+                st.success(f"✅ {len(downloaded_files)} activités disponibles")
+                folder = store.previews_dir if preview_mode else store.streams_dir
+                files = downloaded_files
                 
             except Exception as e:
                 st.error(f"❌ Erreur Strava: {e}")
@@ -388,6 +406,7 @@ if generate_button:
                 
                 video_path = main_pipeline(
                     folder=folder,
+                    files=files,
                     skip_frames=skip_frames,
                     skip_loading=skip_loading,
                     frames_folder=os.path.join(temp_dir, frame_folder),
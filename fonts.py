@@ -0,0 +1,176 @@
+# fonts.py
+# -*- coding: utf-8 -*-
+"""
+Font lookup and text sprites.
+
+Fonts are resolved on a search path and loaded once per (font, size) for the
+whole process, instead of once per frame. Text that is redrawn on every frame
+(the km counter) is assembled from glyph sprites rasterized once.
+"""
+import os
+import threading
+from PIL import Image, ImageDraw, ImageFont
+
+# Extra font folders, separated by os.pathsep, searched before the defaults
+FONT_PATH_ENV = "GPS_VIDEO_FONT_PATH"
+
+DEFAULT_FONT_DIRS = [
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    os.path.expanduser("~/.fonts"),
+    os.path.expanduser("~/.local/share/fonts"),
+    "/usr/local/share/fonts",
+    "/usr/share/fonts",
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+]
+
+# Preferred fonts, first match wins; matched case-insensitively on file name
+DEFAULT_FONTS = ("Arial.ttf", "LiberationSans-Regular.ttf", "DejaVuSans.ttf")
+
+
+def font_search_path():
+    """Font folders from FONT_PATH_ENV followed by DEFAULT_FONT_DIRS"""
+    extra = [d for d in os.environ.get(FONT_PATH_ENV, "").split(os.pathsep) if d]
+    return extra + DEFAULT_FONT_DIRS
+
+
+class FontRegistry:
+    """
+    Resolve font files on a search path and keep every loaded
+    (font, size) pair for the life of the process.
+    """
+
+    def __init__(self, search_path=None):
+        """
+        Args:
+            search_path: Folders searched recursively, in order
+                (default: font_search_path())
+        """
+        self.search_path = list(search_path) if search_path is not None else font_search_path()
+        self._files = None
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def _index(self):
+        """Lower-cased file name -> path, first folder of the search path wins"""
+        if self._files is None:
+            files = {}
+            for folder in self.search_path:
+                for root, _, names in os.walk(folder):
+                    for name in names:
+                        if name.lower().endswith((".ttf", ".otf", ".ttc")):
+                            files.setdefault(name.lower(), os.path.join(root, name))
+            self._files = files
+        return self._files
+
+    def resolve(self, names=DEFAULT_FONTS):
+        """
+        Path of the first font found among names (file names or paths)
+
+        Returns:
+            str or None if none of them is installed
+        """
+        if isinstance(names, str):
+            names = (names,)
+        for name in names:
+            if os.path.isabs(name) and os.path.exists(name):
+                return name
+            path = self._index().get(os.path.basename(name).lower())
+            if path:
+                return path
+        return None
+
+    def get(self, size, names=DEFAULT_FONTS):
+        """
+        Font of the given size, loaded once. Falls back to Pillow's
+        default font when none of names is installed.
+        """
+        if isinstance(names, str):
+            names = (names,)
+        key = (tuple(names), size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                path = self.resolve(names)
+                if path:
+                    font = ImageFont.truetype(path, size)
+                else:
+                    try:
+                        font = ImageFont.load_default(size)
+                    except TypeError:
+                        # Pillow < 10.1: fixed-size bitmap font
+                        font = ImageFont.load_default()
+                self._fonts[key] = font
+        return font
+
+
+_registry = FontRegistry()
+
+
+def get_font(size, names=DEFAULT_FONTS):
+    """Font from the process-wide registry"""
+    return _registry.get(size, names)
+
+
+class GlyphSprites:
+    """
+    Draw short texts from per-character sprites (glyph plus optional drop
+    shadow), each rasterized once. Meant for counters whose characters
+    come from a small set, such as digits.
+    """
+
+    def __init__(self, font, fill, shadow_fill=None, shadow_offset=(2, 2), preload="0123456789"):
+        """
+        Args:
+            font: FreeType font
+            fill: RGB colour of the text
+            shadow_fill: RGB colour of the drop shadow (None for no shadow)
+            shadow_offset: (dx, dy) of the shadow relative to the text
+            preload: Characters rasterized up front
+        """
+        self.font = font
+        self.fill = fill
+        self.shadow_fill = shadow_fill
+        self.shadow_offset = shadow_offset
+        self.descent = font.getmetrics()[1]
+        self._sprites = {}
+        for char in preload:
+            self._sprite(char)
+
+    def _sprite(self, char):
+        """(RGBA sprite, offset from the pen position on the baseline, advance)"""
+        sprite = self._sprites.get(char)
+        if sprite is not None:
+            return sprite
+        left, top, right, bottom = self.font.getbbox(char, anchor="ls")
+        dx, dy = self.shadow_offset if self.shadow_fill is not None else (0, 0)
+        x0, y0 = min(left, left + dx), min(top, top + dy)
+        x1, y1 = max(right, right + dx), max(bottom, bottom + dy)
+        size = (max(x1 - x0, 1), max(y1 - y0, 1))
+        # Each layer is the glyph coverage as alpha; compositing the text
+        # over the shadow gives the same pixels as drawing them in turn
+        image = Image.new("RGBA", size, (0, 0, 0, 0))
+        layers = [(self.fill, (-x0, -y0))]
+        if self.shadow_fill is not None:
+            layers.insert(0, (self.shadow_fill, (dx - x0, dy - y0)))
+        for fill, origin in layers:
+            mask = Image.new("L", size, 0)
+            ImageDraw.Draw(mask).text(origin, char, fill=255, font=self.font, anchor="ls")
+            layer = Image.new("RGBA", size, tuple(fill) + (0,))
+            layer.putalpha(mask)
+            image = Image.alpha_composite(image, layer)
+        sprite = (image, (x0, y0), self.font.getlength(char))
+        self._sprites[char] = sprite
+        return sprite
+
+    def draw(self, image, xy, text):
+        """
+        Paste text on image, anchored like ImageDraw.text(..., anchor="rd"):
+        xy is the right end of the text on its descender line.
+        """
+        sprites = [self._sprite(char) for char in text]
+        x = xy[0] - sum(advance for _, _, advance in sprites)
+        baseline = xy[1] - self.descent
+        for sprite, (ox, oy), advance in sprites:
+            image.paste(sprite, (round(x) + ox, baseline + oy), sprite)
+            x += advance
@@ -0,0 +1,128 @@
+# frame_compositor.py
+# -*- coding: utf-8 -*-
+"""
+Incremental frame compositing: a downscaled copy of the supersampled canvas is
+kept up to date one dirty rectangle at a time, and the position marker is
+painted into a small patch, so the per-frame cost depends on the size of the
+change and not on the size of the canvas.
+
+Route traces are rasterized into sparse layers (bounding box plus coverage
+mask) and flattened into the canvas once, instead of one segment at a time.
+"""
+from PIL import Image, ImageDraw
+
+# LANCZOS spreads a change over 3 output pixels on each side: patches are
+# grown (and their source crops padded) by this much so that a patch is
+# identical to the same area of a full-image resize
+FILTER_MARGIN = 4
+
+
+class TraceLayer:
+    """
+    Polyline rasterized once into a coverage mask limited to its bounding
+    box. Traces are opaque, so flattening a layer is visually identical to
+    drawing its segments one by one on the canvas; Pillow rasterizes wide
+    lines relative to the image they are drawn on, so a pixel or two along
+    the edge of the trace can differ, mostly where it leaves the canvas.
+    """
+
+    def __init__(self, points, color, width=3):
+        """
+        Args:
+            points: [(x, y), ...] canvas coordinates of the polyline
+            color: RGB colour of the trace
+            width: Line width in canvas pixels
+        """
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        x0, y0 = min(xs) - width, min(ys) - width
+        self.box = (x0, y0, max(xs) + width + 1, max(ys) + width + 1)
+        self.color = color
+        self.mask = Image.new("L", (self.box[2] - x0, self.box[3] - y0), 0)
+        ImageDraw.Draw(self.mask).line([(x - x0, y - y0) for x, y in points], fill=255, width=width)
+
+
+class MarkerCompositor:
+    """Flatten route traces into a supersampled canvas and produce marker frames"""
+
+    def __init__(self, canvas, size, marker_radius=7,
+                 marker_fill=(255, 140, 0, 140), marker_outline=(0, 0, 0, 255)):
+        """
+        Args:
+            canvas: Supersampled PIL image the route is drawn on (kept up to date)
+            size: (width, height) of the output frames
+            marker_radius: Marker radius in output pixels
+            marker_fill: RGBA fill of the marker
+            marker_outline: RGBA outline of the marker
+        """
+        self.canvas = canvas
+        self.size = tuple(size)
+        self.scale = canvas.width // self.size[0]
+        self.marker_radius = marker_radius
+        self.marker_fill = marker_fill
+        self.marker_outline = marker_outline
+        self.base = canvas.resize(self.size, Image.LANCZOS).convert("RGB")
+        self._dirty = None
+
+    def add_layer(self, layer):
+        """Flatten a TraceLayer into the canvas; the base is refreshed lazily"""
+        self.canvas.paste(layer.color, layer.box, layer.mask)
+        self._mark_dirty(layer.box)
+
+    def _mark_dirty(self, box):
+        if self._dirty is None:
+            self._dirty = box
+        else:
+            d = self._dirty
+            self._dirty = (min(d[0], box[0]), min(d[1], box[1]), max(d[2], box[2]), max(d[3], box[3]))
+
+    def _output_box(self, box):
+        """Output-pixel box affected by a change in a canvas box, clamped to the frame"""
+        s, m = self.scale, FILTER_MARGIN
+        return (max(box[0] // s - m, 0), max(box[1] // s - m, 0),
+                min(-(-box[2] // s) + m, self.size[0]), min(-(-box[3] // s) + m, self.size[1]))
+
+    def refresh(self):
+        """Downscale only the area touched since the last refresh into the base"""
+        if self._dirty is None:
+            return
+        lx0, ly0, lx1, ly1 = self._output_box(self._dirty)
+        self._dirty = None
+        if lx0 >= lx1 or ly0 >= ly1:
+            return
+        s = self.scale
+        patch = self.canvas.resize((lx1 - lx0, ly1 - ly0), Image.LANCZOS, box=(lx0*s, ly0*s, lx1*s, ly1*s))
+        self.base.paste(patch.convert("RGB"), (lx0, ly0))
+
+    def frame(self, x, y):
+        """
+        Frame showing the route so far and the marker at canvas position (x, y)
+
+        Returns:
+            PIL.Image: RGB frame at output size
+        """
+        self.refresh()
+        frame = self.base.copy()
+
+        s = self.scale
+        r = self.marker_radius * s
+        lx0, ly0, lx1, ly1 = self._output_box((x - r - 1, y - r - 1, x + r + 2, y + r + 2))
+        if lx0 >= lx1 or ly0 >= ly1:
+            return frame
+
+        # Supersampled crop around the marker, padded for the resampling filter
+        m = FILTER_MARGIN * s
+        cx0, cy0 = max(lx0*s - m, 0), max(ly0*s - m, 0)
+        cx1, cy1 = min(lx1*s + m, self.canvas.width), min(ly1*s + m, self.canvas.height)
+        patch_hi = self.canvas.crop((cx0, cy0, cx1, cy1)).convert("RGBA")
+        overlay = Image.new("RGBA", patch_hi.size, (0, 0, 0, 0))
+        draw_overlay = ImageDraw.Draw(overlay)
+        mx, my = x - cx0, y - cy0
+        draw_overlay.ellipse((mx-r, my-r, mx+r, my+r), fill=self.marker_fill)
+        draw_overlay.ellipse((mx-r-1, my-r-1, mx+r+1, my+r+1), outline=self.marker_outline, width=1*s)
+        patch_hi = Image.alpha_composite(patch_hi, overlay)
+
+        box = (lx0*s - cx0, ly0*s - cy0, lx1*s - cx0, ly1*s - cy0)
+        patch = patch_hi.resize((lx1 - lx0, ly1 - ly0), Image.LANCZOS, box=box)
+        frame.paste(patch.convert("RGB"), (lx0, ly0))
+        return frame
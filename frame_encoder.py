@@ -0,0 +1,257 @@
+# frame_encoder.py
+# -*- coding: utf-8 -*-
+"""
+Streaming video encoder: each frame is piped to ffmpeg as soon as it is drawn,
+so memory use stays at a few frames whatever the length of the history.
+
+The speed-up is applied by frame selection before encoding and the music is
+muxed by the same ffmpeg process, so the final video is written in one pass.
+Video-only segments encoded by separate runs can be joined without
+re-encoding (concat_videos).
+"""
+import math
+import os
+import subprocess as sp
+import numpy as np
+from moviepy.config import get_setting
+
+
+def _output_frames_before(source_index, speed_factor):
+    """Number of output frames showing a source frame before source_index"""
+    k = math.ceil(source_index / speed_factor)
+    while k > 0 and int((k - 1) * speed_factor) >= source_index:
+        k -= 1
+    while int(k * speed_factor) < source_index:
+        k += 1
+    return k
+
+
+def plan_frames(source_frames, speed_factor=1.0, source_offset=0):
+    """
+    Work out ahead of time which source frames survive the speed-up.
+
+    Output frame k shows source frame floor(k * speed_factor), exactly as
+    FrameEncoder selects them, so a renderer can skip drawing every frame
+    whose count is 0.
+
+    Args:
+        source_offset: Index of the first source frame, for an encoder
+            continuing a previous run (see FrameEncoder source_offset)
+
+    Returns:
+        np.ndarray: Number of times each source frame appears in the output
+    """
+    if speed_factor <= 0:
+        raise ValueError(f"speed_factor must be positive, got {speed_factor}")
+    first = _output_frames_before(source_offset, speed_factor)
+    last = _output_frames_before(source_offset + source_frames, speed_factor)
+    indices = (np.arange(first, last) * float(speed_factor)).astype(np.int64) - source_offset
+    return np.bincount(indices, minlength=source_frames)[:source_frames]
+
+
+def _audio_args(audio_file, duration=None, audio_fade_in=1.0, audio_fade_out=2.0, shortest=True):
+    """ffmpeg arguments adding looped, faded music as input 1"""
+    args = ["-stream_loop", "-1"]
+    if duration:
+        args += ["-t", "%.03f" % duration]
+    args += ["-i", audio_file, "-map", "0:v:0", "-map", "1:a:0"]
+    fades = [f"afade=t=in:st=0:d={audio_fade_in}"]
+    if duration:
+        fade_out = min(audio_fade_out, duration)
+        fades.append(f"afade=t=out:st={max(duration - fade_out, 0):.03f}:d={fade_out}")
+    args += ["-af", ",".join(fades), "-acodec", "aac"]
+    return args + ["-shortest"] if shortest else args
+
+
+def _popen_params():
+    params = {"stdout": sp.DEVNULL, "stderr": sp.PIPE, "stdin": sp.PIPE}
+    if os.name == "nt":
+        params["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+    return params
+
+
+class FrameEncoder:
+    """
+    Write frames one by one to an H.264 video through an ffmpeg pipe.
+
+    ffmpeg writes to a partial file that replaces output_file only when
+    close() succeeds, so an aborted render leaves any previous video intact.
+    """
+
+    def __init__(self, output_file, size, fps=24, codec="libx264", preset="medium",
+                 speed_factor=1.0, audio_file=None, duration=None,
+                 audio_fade_in=1.0, audio_fade_out=2.0, source_offset=0):
+        """
+        Args:
+            output_file: Path of the video to write
+            size: (width, height) of the frames
+            fps: Frames per second of the output
+            codec: ffmpeg video codec
+            preset: ffmpeg encoding preset
+            speed_factor: Video speed multiplier, applied by dropping
+                (or repeating) source frames before they reach ffmpeg
+            audio_file: Optional music muxed in the same run (looped if too short)
+            duration: Expected output duration in seconds, used to place
+                the audio fade-out; see output_duration()
+            audio_fade_in: Audio fade-in length in seconds
+            audio_fade_out: Audio fade-out length in seconds
+            source_offset: Number of source frames already encoded by a
+                previous segment; the frame selection carries on from
+                there so that the segments join seamlessly
+        """
+        if speed_factor <= 0:
+            raise ValueError(f"speed_factor must be positive, got {speed_factor}")
+        self.output_file = output_file
+        root, ext = os.path.splitext(output_file)
+        self.partial_file = f"{root}.partial{ext}"
+        self.size = tuple(size)
+        self.fps = fps
+        self.speed_factor = float(speed_factor)
+        # Both counts include the frames of previous segments
+        self.source_count = source_offset
+        self.frame_count = _output_frames_before(source_offset, self.speed_factor)
+        self.last_frame = None
+
+        cmd = [
+            get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-vcodec", "rawvideo",
+            "-s", "%dx%d" % self.size, "-pix_fmt", "rgb24",
+            "-r", "%.02f" % fps, "-i", "-",
+        ]
+        if audio_file:
+            cmd += _audio_args(audio_file, duration, audio_fade_in, audio_fade_out)
+        else:
+            cmd += ["-an"]
+        cmd += ["-vcodec", codec, "-preset", preset]
+        if codec == "libx264" and self.size[0] % 2 == 0 and self.size[1] % 2 == 0:
+            cmd += ["-pix_fmt", "yuv420p"]
+        cmd += [self.partial_file]
+
+        self.proc = sp.Popen(cmd, **_popen_params())
+
+    @staticmethod
+    def output_duration(source_frames, fps=24, speed_factor=1.0):
+        """Duration (s) of the video produced from source_frames frames"""
+        return math.ceil(source_frames / speed_factor) / fps
+
+    def write_frame(self, frame):
+        """
+        Feed one source frame (PIL image or HxWx3 uint8 array).
+        With speed_factor > 1 most source frames are dropped here, before
+        any encoding work is done.
+        """
+        array = np.asarray(frame, dtype=np.uint8)
+        if array.ndim == 2:
+            array = np.stack([array]*3, axis=-1)
+        elif array.shape[2] == 4:
+            array = array[:, :, :3]
+        if (array.shape[1], array.shape[0]) != self.size:
+            raise ValueError(f"Frame size {array.shape[1]}x{array.shape[0]} does not match encoder size {self.size[0]}x{self.size[1]}")
+        self.last_frame = array
+
+        # Output frame k shows source frame floor(k * speed_factor)
+        index = self.source_count
+        self.source_count += 1
+        data = None
+        while int(self.frame_count * self.speed_factor) == index:
+            if data is None:
+                # A contiguous array (or memmap slice) is piped without a copy
+                data = np.ascontiguousarray(array).data
+            self._write(data)
+            self.frame_count += 1
+
+    def skip_frame(self, count=1):
+        """
+        Advance past source frames that were not drawn because the
+        speed-up drops them (see plan_frames)
+        """
+        for _ in range(count):
+            if int(self.frame_count * self.speed_factor) == self.source_count:
+                raise ValueError(f"Source frame {self.source_count} is part of the output and cannot be skipped")
+            self.source_count += 1
+
+    def _write(self, data):
+        try:
+            self.proc.stdin.write(data)
+        except (IOError, OSError) as err:
+            error = self.proc.stderr.read().decode(errors="replace")
+            raise IOError(f"ffmpeg failed while writing {self.output_file}: {err}\n{error}")
+
+    def hold(self, seconds):
+        """Repeat the last frame for the given (pre speed-up) duration"""
+        if self.last_frame is None:
+            return
+        for _ in range(int(round(seconds * self.fps))):
+            self.write_frame(self.last_frame)
+
+    def close(self):
+        """Flush and close the ffmpeg process"""
+        if self.proc is None:
+            return
+        _, error = self.proc.communicate()
+        returncode = self.proc.returncode
+        self.proc = None
+        if returncode != 0:
+            if os.path.exists(self.partial_file):
+                os.remove(self.partial_file)
+            raise IOError(f"ffmpeg failed to write {self.output_file}:\n{error.decode(errors='replace')}")
+        os.replace(self.partial_file, self.output_file)
+
+    def abort(self):
+        """Stop ffmpeg and remove the partial output"""
+        if self.proc is None:
+            return
+        self.proc.kill()
+        self.proc.communicate()
+        self.proc = None
+        if os.path.exists(self.partial_file):
+            os.remove(self.partial_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def concat_videos(segment_files, output_file, audio_file=None, duration=None,
+                  audio_fade_in=1.0, audio_fade_out=2.0):
+    """
+    Join video-only segments written by FrameEncoder with the same size,
+    fps and codec, copying the video stream instead of re-encoding it.
+    The music is muxed in the same run.
+
+    Args:
+        segment_files: Segments in playback order
+        output_file: Path of the joined video
+        audio_file: Optional music (looped if too short)
+        duration: Total duration in seconds, used to place the audio fade-out
+    """
+    list_path = f"{output_file}.concat.txt"
+    with open(list_path, "w") as f:
+        for segment in segment_files:
+            escaped = os.path.abspath(segment).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+    ]
+    if audio_file:
+        # With a copied video stream -shortest cuts the last frames: the
+        # music is trimmed by -t instead when the duration is known
+        cmd += _audio_args(audio_file, duration, audio_fade_in, audio_fade_out,
+                           shortest=duration is None)
+    else:
+        cmd += ["-an"]
+    cmd += ["-vcodec", "copy", output_file]
+    try:
+        proc = sp.Popen(cmd, **_popen_params())
+        _, error = proc.communicate()
+    finally:
+        os.remove(list_path)
+    if proc.returncode != 0:
+        raise IOError(f"ffmpeg failed to write {output_file}:\n{error.decode(errors='replace')}")
+    return output_file
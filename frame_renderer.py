@@ -0,0 +1,103 @@
+# frame_renderer.py
+# -*- coding: utf-8 -*-
+"""
+Frame rendering from a stream of FrameSteps.
+
+A frame only depends on the cumulative canvas up to its segment and on its
+marker and counter. The segments of a course are not drawn one by one: the
+run of segments since the previous rendered frame is rasterized as one
+TraceLayer and flattened into the canvas, so completed history costs nothing
+more per frame.
+"""
+from collections import namedtuple
+from frame_compositor import MarkerCompositor, TraceLayer
+from fonts import get_font, GlyphSprites
+
+# One source frame: course = index of the course, whose segments join end
+# to start; line = [x0, y0, x1, y1] segment drawn on the supersampled
+# canvas; marker = (x, y) canvas position of the marker; text = counter
+# text; name = frame name for persistence; render = False for frames
+# dropped by the speed-up (the segment is still drawn)
+FrameStep = namedtuple("FrameStep", ["course", "line", "color", "marker", "text", "name", "render"])
+
+# Counter drawn on every frame, anchored by its bottom right corner at xy
+CounterStyle = namedtuple("CounterStyle", ["xy", "font_size", "fill", "shadow_fill", "shadow_offset"])
+
+
+class TraceBuilder:
+    """Collect consecutive segments of a course and flatten them as one layer"""
+
+    def __init__(self, flatten, line_width=3):
+        """
+        Args:
+            flatten: Callable receiving each TraceLayer
+        """
+        self.flatten = flatten
+        self.line_width = line_width
+        self._course = None
+        self._color = None
+        self._points = []
+
+    def add(self, step):
+        """Queue the segment of step"""
+        if self._points and step.course != self._course:
+            self.flush()
+        if not self._points:
+            self._points = [tuple(step.line[:2])]
+        self._points.append(tuple(step.line[2:]))
+        self._course = step.course
+        self._color = step.color
+
+    def flush(self):
+        """Flatten the queued segments"""
+        if len(self._points) > 1:
+            self.flatten(TraceLayer(self._points, self._color, self.line_width))
+        self._points = []
+
+
+class FrameRenderer:
+    """Draw steps on a canvas and produce their frames"""
+
+    def __init__(self, canvas, size, counter_style, line_width=3, marker_radius=7):
+        """
+        Args:
+            canvas: Supersampled PIL image, updated in place
+            size: (width, height) of the frames
+            counter_style: CounterStyle of the km counter
+        """
+        self.compositor = MarkerCompositor(canvas, size, marker_radius=marker_radius)
+        self.counter_style = counter_style
+        self.counter = GlyphSprites(get_font(counter_style.font_size), fill=counter_style.fill,
+                                    shadow_fill=counter_style.shadow_fill,
+                                    shadow_offset=counter_style.shadow_offset)
+        self.traces = TraceBuilder(self.compositor.add_layer, line_width)
+
+    def step(self, step):
+        """Add the segment of step; returns its frame (PIL) or None"""
+        self.traces.add(step)
+        if not step.render:
+            return None
+        self.traces.flush()
+        frame = self.compositor.frame(*step.marker)
+        self.counter.draw(frame, self.counter_style.xy, step.text)
+        return frame
+
+
+def render_frames(canvas, size, steps, counter_style, line_width=3, marker_radius=7):
+    """
+    Render steps in order
+
+    Args:
+        canvas: Supersampled PIL image; every segment is drawn on it
+        size: (width, height) of the frames
+        steps: Iterable of FrameStep, consumed lazily
+        counter_style: CounterStyle of the km counter
+
+    Yields:
+        tuple: (step, frame) where frame is a PIL image, or None for a step
+            that is not rendered
+    """
+    renderer = FrameRenderer(canvas, size, counter_style, line_width, marker_radius)
+    for step in steps:
+        yield step, renderer.step(step)
+    renderer.traces.flush()
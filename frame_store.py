@@ -0,0 +1,140 @@
+# frame_store.py
+# -*- coding: utf-8 -*-
+"""
+Optional frame persistence, done off the render loop by a background thread.
+
+Frames are appended to a single raw uint8 file with a small JSON index, so a
+resumed run maps the whole sequence at once instead of decoding one PNG per
+frame.
+"""
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+FRAME_STORE_DATA = "frames.raw"
+FRAME_STORE_INDEX = "frames.json"
+
+
+class AsyncFrameWriter:
+    """
+    Persist frames from a background thread.
+    The queue is bounded so at most a few frames wait in memory; the render
+    loop only blocks if the disk cannot keep up.
+    """
+
+    def __init__(self, write, max_pending=16):
+        """
+        Args:
+            write: Callable (name, array) run on the writer thread
+            max_pending: Maximum number of frames waiting to be written
+        """
+        self._write = write
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+
+    def put(self, name, frame):
+        """Queue a frame (PIL image or array) for writing"""
+        if self._error is not None:
+            raise IOError(f"Frame writer failed: {self._error}")
+        self._queue.put((name, np.array(frame, dtype=np.uint8)))
+
+    def close(self):
+        """Wait for every queued frame to be written"""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise IOError(f"Frame writer failed: {self._error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FrameStoreWriter:
+    """
+    Append frames to frames.raw; the index is written by close(), so an
+    interrupted run never leaves a store that looks complete.
+    """
+
+    def __init__(self, folder, size, speed_factor=1.0):
+        """
+        Args:
+            folder: Frames folder
+            size: (width, height) of the frames
+            speed_factor: Speed-up already applied by frame selection
+        """
+        self.folder = folder
+        self.size = tuple(size)
+        self.speed_factor = speed_factor
+        self.names = []
+        os.makedirs(folder, exist_ok=True)
+        index_path = os.path.join(folder, FRAME_STORE_INDEX)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        self._file = open(os.path.join(folder, FRAME_STORE_DATA), "wb")
+
+    def append(self, name, array):
+        """Write one HxWx3 uint8 frame"""
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        if array.shape != (self.size[1], self.size[0], 3):
+            raise ValueError(f"Frame shape {array.shape} does not match store size {self.size}")
+        self._file.write(array.data)
+        self.names.append(name)
+
+    def close(self):
+        """Flush the data file and write the index"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        index = {
+            "width": self.size[0],
+            "height": self.size[1],
+            "channels": 3,
+            "count": len(self.names),
+            "speed_factor": self.speed_factor,
+            "names": self.names,
+        }
+        with open(os.path.join(self.folder, FRAME_STORE_INDEX), "w") as f:
+            json.dump(index, f)
+
+
+def has_frame_store(folder):
+    """True if folder holds a complete frame store"""
+    return (os.path.exists(os.path.join(folder, FRAME_STORE_INDEX))
+            and os.path.exists(os.path.join(folder, FRAME_STORE_DATA)))
+
+
+def open_frame_store(folder):
+    """
+    Map a frame store without reading it
+
+    Returns:
+        tuple: (frames, index) where frames is a read-only
+            (count, height, width, 3) uint8 memmap and index the JSON index
+    """
+    with open(os.path.join(folder, FRAME_STORE_INDEX)) as f:
+        index = json.load(f)
+    shape = (index["count"], index["height"], index["width"], index["channels"])
+    if not index["count"]:
+        return np.empty(shape, dtype=np.uint8), index
+    frames = np.memmap(os.path.join(folder, FRAME_STORE_DATA), dtype=np.uint8, mode="r", shape=shape)
+    return frames, index
@@ -1,22 +1,165 @@
 from staticmap import StaticMap, CircleMarker
-from PIL import Image
+from PIL import Image, ImageDraw
+from fonts import get_font
+from collections import OrderedDict
+import hashlib
 import io
+import os
+import threading
+import requests
+
+OSM_URL_TEMPLATE = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+DEFAULT_COPYRIGHT = "©RunnerSuresnois"
+# Zoom maximal servi par tile.openstreetmap.org
+MAX_TILE_ZOOM = 19
+
+# Fonds de carte déjà rendus dans ce processus (LRU)
+_BACKGROUND_MEMORY = OrderedDict()
+BACKGROUND_MEMORY_SIZE = 8
+
+
+class TileCache:
+    """
+    Cache disque des tuiles, rangées en arborescence <source>/z/x/y.png :
+    chaque serveur de tuiles (url_template) a son propre dossier, pour ne
+    jamais renvoyer les tuiles d'un autre style. La taille totale du
+    cache, toutes sources confondues, est bornée : les tuiles les moins récemment utilisées
+    sont supprimées en premier (LRU, d'après la date de modification).
+    """
+
+    def __init__(self, cache_dir="tile_cache", max_bytes=500 * 1024 * 1024, url_template=OSM_URL_TEMPLATE):
+        """
+        Args:
+            cache_dir: Dossier racine du cache
+            max_bytes: Taille maximale du cache en octets
+            url_template: Serveur de tuiles dont les tuiles sont cachées
+        """
+        self.cache_dir = cache_dir
+        self.source_dir = os.path.join(cache_dir, hashlib.sha1(url_template.encode()).hexdigest()[:12])
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = sum(size for _, _, size in self._entries())
+
+    def path(self, z, x, y):
+        return os.path.join(self.source_dir, str(z), str(x), f"{y}.png")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".png"):
+                    p = os.path.join(root, name)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    yield p, st.st_mtime, st.st_size
+
+    def get(self, z, x, y):
+        """Retourne le contenu de la tuile, ou None si absente"""
+        p = self.path(z, x, y)
+        try:
+            with open(p, "rb") as f:
+                data = f.read()
+            os.utime(p)  # marque la tuile comme récemment utilisée
+            return data
+        except OSError:
+            return None
+
+    def put(self, z, x, y, data):
+        """Enregistre une tuile puis applique la limite de taille"""
+        p = self.path(z, x, y)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        with self._lock:
+            old_size = os.path.getsize(p) if os.path.exists(p) else 0
+            os.replace(tmp, p)
+            self._total += len(data) - old_size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Supprime les tuiles les plus anciennes jusqu'à repasser sous 90% de la limite"""
+        target = self.max_bytes * 0.9
+        for p, _, size in sorted(self._entries(), key=lambda e: e[1]):
+            if self._total <= target:
+                break
+            try:
+                os.remove(p)
+                self._total -= size
+            except OSError:
+                pass
+
+
+class CachedStaticMap(StaticMap):
+    """
+    StaticMap dont les tuiles viennent d'abord d'un dossier local ou du
+    cache disque, et seulement ensuite du serveur de tuiles.
+    """
+
+    def __init__(self, width, height, url_template=OSM_URL_TEMPLATE, tile_cache=None,
+                 tile_dir=None, offline=False, **kwargs):
+        """
+        Args:
+            url_template: Serveur de tuiles (OSM ou serveur local de remplacement)
+            tile_cache: TileCache utilisé en lecture et écriture (optionnel)
+            tile_dir: Dossier de tuiles z/x/y.png en lecture seule (optionnel)
+            offline: Ne jamais utiliser le réseau
+        """
+        # staticmap ne transmet que l'URL à get() : on lui fait produire
+        # "z/x/y" pour retrouver les coordonnées de la tuile
+        super().__init__(width, height, url_template="{z}/{x}/{y}", **kwargs)
+        self.remote_url_template = url_template
+        self.tile_cache = tile_cache
+        self.tile_dir = tile_dir
+        self.offline = offline
+
+    def get(self, url, **kwargs):
+        z, x, y = (int(v) for v in url.split("/"))
+        if self.tile_dir:
+            local_path = os.path.join(self.tile_dir, str(z), str(x), f"{y}.png")
+            if os.path.exists(local_path):
+                with open(local_path, "rb") as f:
+                    return 200, f.read()
+        if self.tile_cache is not None:
+            data = self.tile_cache.get(z, x, y)
+            if data is not None:
+                return 200, data
+        if self.offline:
+            return 404, None
+        res = requests.get(self.remote_url_template.format(z=z, x=x, y=y), **kwargs)
+        if res.status_code == 200 and self.tile_cache is not None:
+            self.tile_cache.put(z, x, y, res.content)
+        return res.status_code, res.content
+
 
 def generate_map_image(
     img_width=800,
     img_height=534,
     center_lat=48.8504,
     center_lon=2.2181,
-    zoom=13
+    zoom=13,
+    url_template=OSM_URL_TEMPLATE,
+    tile_cache_dir="tile_cache",
+    tile_dir=None,
+    offline=False,
+    max_cache_mb=500
 ):
     """
     Génère une image de carte centrée sur les coordonnées spécifiées.
     Retourne directement une image PIL (pas enregistrée sur disque).
+
+    Les tuiles sont lues dans tile_dir puis dans le cache tile_cache_dir
+    avant d'être téléchargées ; avec offline=True la carte est rendue
+    uniquement à partir des tuiles locales.
     """
-    
+    tile_cache = (TileCache(tile_cache_dir, max_cache_mb * 1024 * 1024, url_template)
+                  if tile_cache_dir else None)
+
     # Créer la carte
-    m = StaticMap(img_width, img_height,
-                  url_template='https://tile.openstreetmap.org/{z}/{x}/{y}.png')
+    m = CachedStaticMap(img_width, img_height, url_template=url_template,
+                        tile_cache=tile_cache, tile_dir=tile_dir, offline=offline)
 
     # Ajouter un marqueur invisible pour centrer
     marker = CircleMarker((center_lon, center_lat), "#00000000", 0)
@@ -25,4 +168,106 @@ def generate_map_image(
     # Rendu de l'image sous forme d'image PIL
     image = m.render(zoom=zoom)
 
-    return image
\ No newline at end of file
+    return image
+
+
+def add_copyright(img, text=DEFAULT_COPYRIGHT):
+    """
+    Ajoute un copyright en bas à gauche de l'image.
+    img = image PIL
+    Retourne une image PIL
+    """
+    image = img.copy()
+    draw = ImageDraw.Draw(image)
+    # couleur et style
+    font_size = max(16, image.width // 40)
+    font = get_font(font_size)  # chargée une seule fois par processus
+    margin = 10
+    x = margin
+    y = image.height - font_size - margin
+    draw.text((x, y), text, fill=(255, 255, 255), font=font)
+
+    return image
+
+
+def generate_supersampled_map_image(img_width, img_height, center_lat, center_lon, zoom,
+                                    super_scale=2, **tile_options):
+    """
+    Carte de (img_width * super_scale, img_height * super_scale) pixels
+    couvrant exactement la même zone que generate_map_image(img_width,
+    img_height, ..., zoom).
+
+    Pour un super_scale puissance de 2, la carte est rendue directement
+    avec les tuiles du zoom + log2(super_scale) : aucun rééchantillonnage,
+    et chaque pixel correspond aux coordonnées de latlon_to_pixel(...,
+    SUPER_SCALE). Sinon (ou au-delà de MAX_TILE_ZOOM), on agrandit la
+    carte normale en LANCZOS.
+    """
+    extra_zoom = super_scale.bit_length() - 1
+    if super_scale >= 1 and 1 << extra_zoom == super_scale and zoom + extra_zoom <= MAX_TILE_ZOOM:
+        return generate_map_image(img_width * super_scale, img_height * super_scale,
+                                  center_lat, center_lon, zoom + extra_zoom, **tile_options)
+    image = generate_map_image(img_width, img_height, center_lat, center_lon, zoom, **tile_options)
+    return image.resize((img_width * super_scale, img_height * super_scale), Image.LANCZOS)
+
+
+def get_background_map(
+    img_width=800,
+    img_height=534,
+    center_lat=48.8504,
+    center_lon=2.2181,
+    zoom=13,
+    super_scale=1,
+    url_template=OSM_URL_TEMPLATE,
+    copyright_text=DEFAULT_COPYRIGHT,
+    cache_dir="map_cache",
+    **tile_options
+):
+    """
+    Fond de carte prêt à dessiner (copyright compris), mémorisé en mémoire
+    et sur disque par (centre, zoom, taille, style, super_scale) : les rendus
+    suivants avec les mêmes paramètres ne coûtent plus rien.
+
+    Args:
+        super_scale: Facteur de suréchantillonnage ; la variante
+            (img_width * super_scale, img_height * super_scale), rendue
+            nativement avec des tuiles plus zoomées, est stockée séparément
+            de la variante à taille normale
+        copyright_text: Texte ajouté par add_copyright (None pour aucun)
+        cache_dir: Dossier du cache disque (None pour le désactiver)
+        tile_options: Options passées à generate_map_image (tile_dir, offline...)
+
+    Retourne une copie PIL, modifiable par l'appelant.
+    """
+    key = (img_width, img_height, round(center_lat, 7), round(center_lon, 7), zoom,
+           super_scale, url_template, copyright_text)
+    if key in _BACKGROUND_MEMORY:
+        _BACKGROUND_MEMORY.move_to_end(key)
+        return _BACKGROUND_MEMORY[key].copy()
+
+    path = None
+    image = None
+    if cache_dir:
+        path = os.path.join(cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".png")
+        if os.path.exists(path):
+            try:
+                with Image.open(path) as cached:
+                    image = cached.convert("RGB")
+            except OSError:
+                image = None
+
+    if image is None:
+        image = generate_supersampled_map_image(img_width, img_height, center_lat, center_lon, zoom,
+                                                super_scale, url_template=url_template, **tile_options)
+        if copyright_text:
+            image = add_copyright(image, copyright_text)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            image.save(tmp, format="PNG")
+            os.replace(tmp, path)
+
+    _BACKGROUND_MEMORY[key] = image
+    while len(_BACKGROUND_MEMORY) > BACKGROUND_MEMORY_SIZE:
+        _BACKGROUND_MEMORY.popitem(last=False)
+    return image.copy()
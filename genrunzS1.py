@@ -1,9 +1,16 @@
 # genrunzS1.py
 # -*- coding: utf-8 -*-
-from gencarte import generate_map_image
+from gencarte import get_background_map
+from frame_encoder import FrameEncoder, plan_frames
+from frame_renderer import FrameStep, CounterStyle, render_frames
+from frame_store import AsyncFrameWriter, FrameStoreWriter, has_frame_store, open_frame_store
+from render_state import RenderCheckpoint
+from palette import color_table
+from geo import MercatorProjection, GeoFilter, CircleRegion
+from tracks import ingest_courses
 import os, glob, gzip, shutil, math, datetime
-import pandas as pd, numpy as np, pytz, gpxpy, fitdecode
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np, pytz
+from PIL import Image
 from moviepy.editor import (
     VideoFileClip, 
     AudioFileClip, 
@@ -42,65 +49,6 @@ def haversine(lat1, lon1, lat2, lon2):
     return bb
 
 
-def green_shade(i, total):
-    """Generate gradient color from green to orange"""
-    import colorsys
-    t = i / max(total - 1, 1)
-    if t < 0.5:
-        k = t / 0.5
-        h = (230 + (270 - 230) * k) / 360
-    else:
-        k = (t - 0.5) / 0.5
-        h = (270 + (120 - 270) * k) / 360
-    s = 0.65
-    v = 0.5
-    r, g, b = colorsys.hsv_to_rgb(h, s, v)
-    return (int(r*255), int(g*255), int(b*255))
-
-
-def read_gpx(filepath):
-    """Read GPX file and return DataFrame with lat/lon"""
-    with open(filepath, "r") as f:
-        gpx = gpxpy.parse(f)
-    points = []
-    for track in gpx.tracks:
-        for seg in track.segments:
-            for p in seg.points:
-                points.append([p.latitude, p.longitude])
-    return pd.DataFrame(points, columns=["lat", "lon"]) if points else pd.DataFrame(columns=["lat","lon"])
-
-
-def read_fit(filepath):
-    """Read FIT file and return DataFrame with lat/lon"""
-    points = []
-    with fitdecode.FitReader(filepath) as fit:
-        for frame in fit:
-            if not isinstance(frame, fitdecode.FitDataMessage):
-                continue
-            if frame.name != "record":
-                continue
-            lat = frame.get_value("position_lat", fallback=None)
-            lon = frame.get_value("position_long", fallback=None)
-            if lat is None or lon is None:
-                continue
-            lat = lat * (180 / 2**31)
-            lon = lon * (180 / 2**31)
-            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
-                continue
-            points.append([lat, lon])
-    return pd.DataFrame(points, columns=["lat", "lon"]) if points else pd.DataFrame(columns=["lat","lon"])
-
-
-def is_near_center(df, center_lat, center_lon, max_distance_km):
-    """Check if any point in route is near the center"""
-    if df.empty:
-        return False
-    for _, row in df.iterrows():
-        if haversine(row["lat"], row["lon"], center_lat, center_lon) <= max_distance_km:
-            return True
-    return False
-
-
 def decompress_gz(filepath):
     """Decompress .gz file"""
     outpath = filepath[:-3]
@@ -111,29 +59,6 @@ def decompress_gz(filepath):
     return outpath
 
 
-def get_gpx_start_time(filepath):
-    """Extract start time from GPX file"""
-    with open(filepath, "r") as f:
-        gpx = gpxpy.parse(f)
-    for track in gpx.tracks:
-        for seg in track.segments:
-            for p in seg.points:
-                if p.time:
-                    return p.time
-    return None
-
-
-def get_fit_start_time(filepath):
-    """Extract start time from FIT file"""
-    with fitdecode.FitReader(filepath) as fit:
-        for frame in fit:
-            if isinstance(frame, fitdecode.FitDataMessage) and frame.name == "record":
-                ts = frame.get_value("timestamp", fallback=None)
-                if ts:
-                    return ts
-    return None
-
-
 def is_valid_frame(frame_path):
     """Check if image file is valid"""
     try:
@@ -165,37 +90,6 @@ def latlon_to_pixel(lat, lon, center_lat, center_lon, img_width, img_height, zoo
     return int(px), int(py)
 
 
-def interpolate_points(points, max_points):
-    """Interpolate points to have at most max_points"""
-    if len(points) <= max_points:
-        return points
-    if max_points == 1:
-        return [points[0]]
-    indices = [int(i*(len(points)-1)/(max_points-1)) for i in range(max_points)]
-    return [points[i] for i in indices]
-
-def add_copyright(img, text="©RunnerSuresnois"):
-    """
-    Ajoute un copyright en bas à gauche de l'image.
-    img = image PIL
-    Retourne une image PIL
-    """
-    image = img.copy()
-    draw = ImageDraw.Draw(image)
-    # couleur et style
-    font_size = max(16, image.width // 40)
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
-    margin = 10
-    x = margin
-    y = image.height - font_size - margin
-    draw.text((x, y), text, fill=(255, 255, 255), font=font)
-
-    return image
-
-
 # ===============================
 # MAIN PIPELINE
 # ===============================
@@ -209,8 +103,17 @@ def main_pipeline(
     skip_loading=False,
     skip_clip=False,
     errase_frame_folder=False,
+    stream_frames=True,
+    persist_frames=False,
     speed_factor=7.0,
     max_frames_per_course = 120,
+    regions=None,
+    workers=None,
+    track_cache_dir="track_cache",
+    checkpoint_dir=None,
+    colormap="index",
+    color_range=None,
+    files=None,
     music_path="audiomachine.mp3",
     output_file="video_final.mp4"):
     
@@ -218,14 +121,39 @@ def main_pipeline(
     Main pipeline to generate video from GPS data
     
     Args:
-        folder: Path to folder containing .gpx/.fit files
+        folder: Path to folder containing .gpx/.fit/.npz files
         skip_frames: Skip frame generation (use existing)
         skip_effects: Skip speed effects
         skip_audio: Skip audio addition
         skip_write: Skip final video write
         skip_loading: Skip file loading
         skip_clip: Skip video clip creation
+        stream_frames: Pipe each frame to the encoder as soon as it is drawn
+            instead of keeping every frame in memory; the speed factor and
+            audio are applied in the same single encoding pass
+        persist_frames: Also save the rendered frames to a memory-mappable
+            frame store in frames_folder (for skip_frames runs), from a
+            background writer thread
         speed_factor: Video speed multiplier
+        regions: geo regions (CircleRegion / PolygonRegion) an activity must
+            pass through; defaults to max_distance_km around the map center
+        workers: Processes used to load the activities (default: all cores)
+        track_cache_dir: Folder of decoded tracks reused by later runs
+            (None to always decode the files)
+        checkpoint_dir: Folder of the render checkpoint (streaming mode). When
+            set, each run saves its canvas, distance counter, processed
+            activities and encoded video there, and the next run only draws
+            and encodes the activities added since
+        colormap: Course colours: "index", "date", "distance" or "type"
+            (see palette.COLORMAPS), or a colormap object
+        color_range: (min, max) of the gradient colormap values, e.g.
+            (0, 365) courses for "index" or two datetimes for "date".
+            Without it, an incremental run keeps the range of the first
+            render so the colours already drawn stay valid, and every
+            course past that range gets the colour at the end of the ramp:
+            set it to leave room for the activities still to come
+        files: Explicit list of GPS files to use instead of every file in
+            folder (e.g. the activities of a period from a Strava store)
         music_path: Path to background music
         output_file: Output video filename
     """
@@ -235,173 +163,314 @@ def main_pipeline(
 
     center_lat, center_lon = 48.8504, 2.2181  # Paris
     max_distance_km = 100
+    geofilter = GeoFilter(regions or [CircleRegion(center_lat, center_lon, max_distance_km)])
     img_width, img_height = 800, 534
     zoom = 13
     fps_final = 24
     # background_map_path = "fond14.png"
     SUPER_SCALE = 2
-    HI_W = img_width * SUPER_SCALE
-    HI_H = img_height * SUPER_SCALE
     
     # if not os.path.exists(background_map_path):
     #     raise FileNotFoundError(f"Background map not found: {background_map_path}") 
     # background_map = Image.open(background_map_path).resize((HI_W, HI_H), Image.LANCZOS)
-    background_map = generate_map_image(img_width, img_height, center_lat, center_lon, zoom)
-    background_map = add_copyright(background_map)
+    # Rendered, copyright-stamped, supersampled basemap, memoized in memory
+    # and on disk so repeat jobs pay nothing for it
+    background_map = get_background_map(img_width, img_height, center_lat, center_lon, zoom,
+                                         super_scale=SUPER_SCALE)
     start_date_limit = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
     temp_video_path = "temptout_video.mp4"
 
+    hold_seconds = 2
+
     frames = []
+    frame_count = 0
+    # Streaming mode: frames go straight to ffmpeg instead of piling up in RAM,
+    # and the speed-up and music are applied by that same single encode
+    streaming = stream_frames and not skip_clip
+    encoder = None
+    speed_applied = 1.0
+    video_speed = speed_factor if not skip_effects else 1.0
+    audio_file = music_path if (not skip_audio and music_path and os.path.exists(music_path)) else None
     distance_accum = 0.0
+    projection = MercatorProjection(center_lat, center_lon, img_width, img_height, zoom, SUPER_SCALE)
     cumulative_img = background_map.copy()
-    cumulative_draw = ImageDraw.Draw(cumulative_img)
-
-    # -----------------------
-    # Load files
-    # -----------------------
-    if not skip_loading:
-        print("Loading GPS files...")
-        gpx_files = sorted(glob.glob(os.path.join(folder, "*.gpx")))
-        fit_files = sorted(glob.glob(os.path.join(folder, "*.fit")))
-        gz_files  = sorted(glob.glob(os.path.join(folder, "*.fit.gz")))
-
-        decompressed = [decompress_gz(gz) for gz in gz_files]
-        candidates = fit_files + decompressed + gpx_files
-
-        def base_no_ext(path):
-            name = os.path.basename(path)
-            for ext in [".fit.gz", ".fit", ".gpx"]:
-                if name.endswith(ext):
-                    return name[:-len(ext)]
-            return os.path.splitext(name)[0]
-
-        ext_priority = [".fit", ".gpx"]
-        by_base = {}
-        for ext in ext_priority:
+    # km counter, pasted from glyphs rasterized once
+    counter_style = CounterStyle((img_width-10, img_height-10), 32, fill=(255, 165, 0),
+                                 shadow_fill=(0, 0, 0), shadow_offset=(2, 2))
+
+    if color_range is not None:
+        color_range = tuple(v.timestamp() if isinstance(v, datetime.datetime) else float(v)
+                            for v in color_range)
+
+    # Incremental mode: a checkpoint made with other settings is discarded
+    checkpoint = None
+    if checkpoint_dir and streaming and not skip_write and not skip_frames:
+        checkpoint = RenderCheckpoint(checkpoint_dir, {
+            "size": [img_width, img_height],
+            "center": [center_lat, center_lon],
+            "zoom": zoom,
+            "super_scale": SUPER_SCALE,
+            "fps": fps_final,
+            "speed_factor": video_speed,
+            "max_frames_per_course": max_frames_per_course,
+            "colormap": colormap if isinstance(colormap, str) else type(colormap).__name__,
+            "color_range": list(color_range) if color_range is not None else None,
+            "start_date_limit": start_date_limit.isoformat(),
+            "regions": [f"{type(r).__name__}{r.bbox}" for r in geofilter.regions],
+        })
+
+    def open_encoder(source_frames):
+        """Start the single-pass encoder once the number of frames is known"""
+        nonlocal encoder
+        if not streaming or skip_write or encoder is not None or not source_frames:
+            return
+        effective_speed = video_speed / speed_applied
+        if checkpoint is not None:
+            # Video-only segment; the music is added when the segments are joined
+            encoder = checkpoint.open_segment((img_width, img_height), fps_final, effective_speed)
+            return
+        hold_frames = round(hold_seconds / speed_applied * fps_final)
+        duration = FrameEncoder.output_duration(source_frames + hold_frames, fps_final, effective_speed)
+        if effective_speed != 1.0:
+            print(f"Applying speed factor: {effective_speed}x")
+        if audio_file:
+            print("Adding audio...")
+        print(f"Writing final video: {output_file}")
+        encoder = FrameEncoder(output_file, (img_width, img_height), fps=fps_final,
+                               speed_factor=effective_speed, audio_file=audio_file, duration=duration)
+
+    def emit_frame(frame):
+        """Send a frame to the encoder (streaming) or keep it for the clip"""
+        nonlocal frame_count
+        if streaming:
+            if encoder is not None:
+                encoder.write_frame(frame)
+        else:
+            frames.append(np.array(frame))
+        frame_count += 1
+
+    # An interrupted render must not leave ffmpeg finishing a truncated
+    # video: the encoder is aborted on any error
+    try:
+        # -----------------------
+        # Load files
+        # -----------------------
+        if not skip_loading:
+            print("Loading GPS files...")
+            if files is not None:
+                gpx_files = [f for f in files if f.lower().endswith(".gpx")]
+                fit_files = [f for f in files if f.lower().endswith(".fit")]
+                gz_files  = [f for f in files if f.lower().endswith(".fit.gz")]
+                npz_files = [f for f in files if f.lower().endswith(".npz")]
+            else:
+                gpx_files = sorted(glob.glob(os.path.join(folder, "*.gpx")))
+                fit_files = sorted(glob.glob(os.path.join(folder, "*.fit")))
+                gz_files  = sorted(glob.glob(os.path.join(folder, "*.fit.gz")))
+                npz_files = sorted(glob.glob(os.path.join(folder, "*.npz")))
+
+            decompressed = [decompress_gz(gz) for gz in gz_files]
+            candidates = fit_files + decompressed + npz_files + gpx_files
+
+            def base_no_ext(path):
+                name = os.path.basename(path)
+                for ext in [".fit.gz", ".fit", ".npz", ".gpx"]:
+                    if name.endswith(ext):
+                        return name[:-len(ext)]
+                return os.path.splitext(name)[0]
+
+            ext_priority = [".fit", ".npz", ".gpx"]
+            by_base = {}
+            for ext in ext_priority:
+                for f in candidates:
+                    if not f.lower().endswith(ext):
+                        continue
+                    base = base_no_ext(f)
+                    if base not in by_base:
+                        by_base[base] = f
             for f in candidates:
-                if not f.lower().endswith(ext):
-                    continue
                 base = base_no_ext(f)
                 if base not in by_base:
                     by_base[base] = f
-        for f in candidates:
-            base = base_no_ext(f)
-            if base not in by_base:
-                by_base[base] = f
-
-        all_files = sorted(by_base.values())
-        total = len(all_files)
-        print(f"Found {total} GPS files")
-    else:
-        all_files = []
-        total = 0
-
-    # -----------------------
-    # Generate frames
-    # -----------------------
-    if not skip_frames and all_files:
-        print("Generating frames...")
-        # Delete existing frames folder and recreate it
-        if not errase_frame_folder:
-            if os.path.exists(frames_folder):
-                shutil.rmtree(frames_folder)
-            os.makedirs(frames_folder, exist_ok=True)
-        for i, file in enumerate(all_files):
-            print(f"Processing {i+1}/{total}: {os.path.basename(file)}")
-            ext = file.split(".")[-1].lower()
-            df = None
-            start_time = None
-
-            # Get start time
-            if ext == "gpx": 
-                start_time = get_gpx_start_time(file)
-            elif ext == "fit": 
-                start_time = get_fit_start_time(file)
-            
-            if start_time is None: 
-                continue
-            if start_time.tzinfo is None: 
-                start_time = start_time.replace(tzinfo=datetime.timezone.utc)
-            if start_time < start_date_limit: 
-                continue
-
-            # Read GPS data
+
+            all_files = sorted(by_base.values())
+            activity_ids = {f: base for base, f in by_base.items()}
+            total = len(all_files)
+            print(f"Found {total} GPS files")
+        else:
+            all_files = []
+            activity_ids = {}
+            total = 0
+
+        # -----------------------
+        # Generate frames
+        # -----------------------
+        if not skip_frames and all_files:
+            print("Generating frames...")
+            # Delete existing frames folder and recreate it
+            if not errase_frame_folder:
+                if os.path.exists(frames_folder):
+                    shutil.rmtree(frames_folder)
+                os.makedirs(frames_folder, exist_ok=True)
+            # Activities already in the checkpoint are neither loaded nor drawn
+            render_files = all_files
+            resume = checkpoint is not None and not checkpoint.is_empty
+            if resume:
+                render_files = [f for f in all_files if activity_ids[f] not in checkpoint.processed]
+                print(f"{total - len(render_files)} activities already rendered, {len(render_files)} new")
+
+            # Parsing, date filtering, geofiltering and subsampling run on a
+            # process pool; courses come back in the sorted file order
+            # Unreadable files are not marked processed, so a later run retries them
+            failed_files = []
+            courses = ingest_courses(render_files, start_date_limit, geofilter,
+                                     max_frames_per_course, workers=workers,
+                                     cache_dir=track_cache_dir, failed=failed_files)
+
+            # New activities can only be appended after the rendered ones
+            if resume and checkpoint.last_start_time and any(c.start_time < checkpoint.last_start_time for c in courses):
+                print("New activities are older than the rendered ones, rendering from scratch")
+                checkpoint.reset()
+                resume = False
+                render_files = all_files
+                failed_files = []
+                courses = ingest_courses(all_files, start_date_limit, geofilter,
+                                         max_frames_per_course, workers=workers,
+                                         cache_dir=track_cache_dir, failed=failed_files)
+
+            # Colour table built once over the activities that passed the filters.
+            # An incremental run keeps the scale of the first render, so that the
+            # colours already drawn remain valid; new courses past that scale
+            # are clipped to the end of the ramp unless color_range leaves room
+            color_domain, color_offset = color_range, 0
+            if resume:
+                cumulative_img = checkpoint.canvas()
+                distance_accum = checkpoint.distance_accum
+                color_domain, color_offset = checkpoint.color_domain or color_range, checkpoint.color_offset
+            colors, color_domain = color_table(courses, colormap, color_domain, color_offset)
+
+            # The frame count is known before drawing, so the encoder can place
+            # the audio fade-out and the whole video is written in one pass
+            source_frames = sum(len(course.points) - 1 for course in courses)
+            open_encoder(source_frames)
+
+            # Only the frames that survive the speed-up are drawn; the skipped
+            # frames still add their segment to the cumulative trace
+            plan = None
+            if encoder is not None and encoder.speed_factor > 1.0:
+                plan = plan_frames(source_frames, encoder.speed_factor, source_offset=encoder.source_count)
+                print(f"Rendering {np.count_nonzero(plan)}/{source_frames} frames")
+
+            def course_steps():
+                """Segment, marker and counter of every source frame, in order"""
+                nonlocal distance_accum
+                source_index = 0
+                for k, (i, _, points, cumulative, course_km, _) in enumerate(courses):
+                    color = tuple(colors[k].tolist())
+                    distance_start = distance_accum
+                    xs, ys = projection.to_pixels(points[:, 0], points[:, 1])
+                    xs, ys = xs.tolist(), ys.tolist()
+                    for j in range(1, len(points)):
+                        distance_accum = distance_start + cumulative[j]
+                        render = plan is None or bool(plan[source_index])
+                        source_index += 1
+                        yield FrameStep(k, [xs[j-1], ys[j-1], xs[j], ys[j]], color, (xs[j], ys[j]),
+                                        f"{round(distance_accum):d} km", f"frame_{i:03d}_{j:03d}", render)
+                    distance_accum = distance_start + course_km
+
+            # The store records the speed-up already applied by the planner, so
+            # a resumed run does not speed the video up twice
+            frame_store = None
+            frame_writer = None
+            if persist_frames:
+                frame_store = FrameStoreWriter(frames_folder, (img_width, img_height),
+                                               speed_factor=encoder.speed_factor if plan is not None else 1.0)
+                frame_writer = AsyncFrameWriter(frame_store.append)
             try:
-                if ext == "gpx": 
-                    df = read_gpx(file)
-                elif ext == "fit": 
-                    df = read_fit(file)
-            except Exception as e:
-                print(f"  Error reading file: {e}")
-                continue
-            
-            if df is None or df.shape[0] < 2: 
-                continue
-            if not is_near_center(df, center_lat, center_lon, max_distance_km): 
-                continue
-
-            # Draw route
-            color = green_shade(i, total)
-            points = df[["lat","lon"]].values.tolist()
-            points = interpolate_points(points, max_frames_per_course)
-
-            for j in range(1, len(points)):
-                x0, y0 = latlon_to_pixel(*points[j-1], center_lat, center_lon, img_width, img_height, zoom, SUPER_SCALE)
-                x1, y1 = latlon_to_pixel(*points[j], center_lat, center_lon, img_width, img_height, zoom, SUPER_SCALE)
-                cumulative_draw.line([x0, y0, x1, y1], fill=color, width=3)
-                
-                lat0, lon0 = points[j-1]
-                lat1, lon1 = points[j]
-                distance_accum += haversine(lat0, lon0, lat1, lon1)
-
-                # Create frame with marker
-                frame_hi = cumulative_img.copy().convert("RGBA")
-                overlay = Image.new("RGBA", (HI_W, HI_H), (0,0,0,0))
-                draw_overlay = ImageDraw.Draw(overlay)
-                r = 7 * SUPER_SCALE
-                draw_overlay.ellipse((x1-r, y1-r, x1+r, y1+r), fill=(255,140,0,140))
-                draw_overlay.ellipse((x1-r-1, y1-r-1, x1+r+1, y1+r+1), outline=(0,0,0,255), width=1*SUPER_SCALE)
-                frame_hi = Image.alpha_composite(frame_hi, overlay)
-                frame = frame_hi.resize((img_width, img_height), Image.LANCZOS).convert("RGB")
-
-                # Add distance text
-                draw_frame = ImageDraw.Draw(frame)
-                text = f"{round(distance_accum):d} km"
-                try:
-                    font = ImageFont.truetype("/Library/Fonts/Arial.ttf", 32)
-                except:
-                    font = ImageFont.load_default()
-                draw_frame.text((img_width-8, img_height-8), text, fill=(0,0,0), font=font, anchor="rd")
-                draw_frame.text((img_width-10, img_height-10), text, fill=(255,165,0), font=font, anchor="rd")
-
-                # Save frame
-                frame_path = os.path.join(frames_folder, f"frame_{i:03d}_{j:03d}.png")
-                frame.save(frame_path)
-                if is_valid_frame(frame_path):
-                    frames.append(np.array(frame))
-
-    # Load existing frames if skipped
-    if (skip_frames or not frames) and os.path.exists(frames_folder):
-        print("Loading existing frames...")
-        frame_files = sorted(glob.glob(os.path.join(frames_folder, "*.png")))
-        for fp in frame_files:
-            if is_valid_frame(fp):
-                frame_array = np.array(Image.open(fp))
-                if len(frame_array.shape) == 2: 
-                    frame_array = np.stack([frame_array]*3, axis=-1)
-                frames.append(frame_array)
-        print(f"Loaded {len(frames)} frames")
-
-    if not frames: 
-        raise ValueError("No frames available")
-
-    # -----------------------
-    # Create video
-    # -----------------------
+                # Route segments, marker and counter, composited incrementally
+                for step, frame in render_frames(cumulative_img, (img_width, img_height), course_steps(),
+                                                 counter_style):
+                    if frame is None:
+                        encoder.skip_frame()
+                        continue
+                    # Frames stay in memory; saving them is an optional side output
+                    emit_frame(frame)
+                    if frame_writer is not None:
+                        frame_writer.put(step.name, frame)
+            finally:
+                if frame_writer is not None:
+                    frame_writer.close()
+                    frame_store.close()
+
+            if checkpoint is not None:
+                if encoder is not None:
+                    encoder.close()
+                start_times = [c.start_time for c in courses]
+                if resume and checkpoint.last_start_time:
+                    start_times.append(checkpoint.last_start_time)
+                checkpoint.commit(cumulative_img, distance_accum,
+                                  checkpoint.processed | {activity_ids[f] for f in render_files
+                                                          if f not in failed_files},
+                                  max(start_times, default=None), color_domain,
+                                  color_offset + len(courses), encoder=encoder)
+
+        # Load existing frames if skipped
+        load_existing = checkpoint is None and (skip_frames or not frame_count)
+        if load_existing and has_frame_store(frames_folder):
+            print("Loading existing frames...")
+            # Zero-copy: the store is memory-mapped and fed straight to the encoder
+            stored_frames, index = open_frame_store(frames_folder)
+            # Frames rendered through the planner are already sped up
+            speed_applied = index["speed_factor"]
+            open_encoder(len(stored_frames))
+            for frame_array in stored_frames:
+                emit_frame(frame_array)
+            print(f"Loaded {frame_count} frames")
+        elif load_existing and os.path.exists(frames_folder):
+            print("Loading existing frames...")
+            frame_files = sorted(glob.glob(os.path.join(frames_folder, "*.png")))
+            open_encoder(len(frame_files))
+            for fp in frame_files:
+                if is_valid_frame(fp):
+                    frame_array = np.array(Image.open(fp))
+                    if len(frame_array.shape) == 2: 
+                        frame_array = np.stack([frame_array]*3, axis=-1)
+                    emit_frame(frame_array)
+            print(f"Loaded {frame_count} frames")
+
+        if checkpoint is not None:
+            # Only the new segment was encoded: the video is joined at the stream level
+            if audio_file:
+                print("Adding audio...")
+            print(f"Writing final video: {output_file}")
+            checkpoint.write_video(output_file, (img_width, img_height), fps_final, video_speed,
+                                   hold_seconds=hold_seconds, audio_file=audio_file)
+            print("Done!")
+            return output_file
+
+        if not frame_count: 
+            if encoder is not None:
+                encoder.abort()
+            raise ValueError("No frames available")
+
+        # -----------------------
+        # Create video
+        # -----------------------
+        if streaming:
+            # Speed-up and audio were applied while encoding: no temporary video
+            if encoder is not None:
+                encoder.hold(hold_seconds / speed_applied)
+                encoder.close()
+                print("Done!")
+            return output_file
+    except BaseException:
+        if encoder is not None:
+            encoder.abort()
+        raise
+
     if not skip_clip:
         print("Creating video clip...")
         clip_main = ImageSequenceClip(frames, fps=fps_final)
-        clip_last = ImageClip(frames[-1]).set_duration(2).set_fps(fps_final)
+        clip_last = ImageClip(frames[-1]).set_duration(hold_seconds).set_fps(fps_final)
         clip_final = concatenate_videoclips([clip_main, clip_last], method="compose")
         clip_final.write_videofile(temp_video_path, codec="libx264", fps=fps_final)
     else:
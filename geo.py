@@ -0,0 +1,193 @@
+# geo.py
+# -*- coding: utf-8 -*-
+"""
+Vectorized geographic helpers: whole tracks are handled as NumPy arrays
+instead of one point at a time.
+"""
+import math
+import numpy as np
+
+# Earth radius used by the Web Mercator projection (m)
+R = 6378137
+
+
+class MercatorProjection:
+    """
+    Web Mercator projection of lat/lon arrays to map pixels.
+    The center and the scale are computed once per map.
+    """
+
+    def __init__(self, center_lat, center_lon, img_width, img_height, zoom, super_scale=1):
+        """
+        Args:
+            center_lat, center_lon: Coordinates of the map center
+            img_width, img_height: Map size in pixels
+            zoom: Tile zoom level of the map
+            super_scale: Supersampling factor applied to the pixel coordinates
+        """
+        self.img_width = img_width
+        self.img_height = img_height
+        self.zoom = zoom
+        self.super_scale = super_scale
+        self.x_center = math.radians(center_lon) * R
+        self.y_center = math.log(math.tan(math.pi/4 + math.radians(center_lat)/2)) * R
+        self.meters_per_pixel = 2 * math.pi * R / (256 * 2**zoom)
+
+    def to_pixels(self, lat, lon):
+        """
+        Convert lat/lon arrays to integer pixel arrays
+
+        Returns:
+            tuple: (px, py) int64 arrays, truncated like latlon_to_pixel
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        x = np.radians(lon) * R
+        y = np.log(np.tan(np.pi/4 + np.radians(lat)/2)) * R
+        px = (self.img_width/2 + (x - self.x_center)/self.meters_per_pixel) * self.super_scale
+        py = (self.img_height/2 - (y - self.y_center)/self.meters_per_pixel) * self.super_scale
+        return px.astype(np.int64), py.astype(np.int64)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distance (km) between points on Earth, element-wise on arrays"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lon2) - np.radians(lon1)
+    a = np.sin(dphi/2)**2 + np.cos(phi1)*np.cos(phi2)*np.sin(dlambda/2)**2
+    return (R / 1000) * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def track_distances(lat, lon):
+    """
+    Per-segment and cumulative distances of a track in one call
+
+    Returns:
+        tuple: (segments, cumulative) in km; segments has n-1 values,
+            cumulative has n values starting at 0
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    segments = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    cumulative = np.concatenate(([0.0], np.cumsum(segments)))
+    return segments, cumulative
+
+
+# Kilometres per degree of latitude on the sphere used by haversine
+KM_PER_DEGREE = math.pi * R / 180 / 1000
+
+
+def track_bbox(lat, lon):
+    """Bounding box (min_lat, min_lon, max_lat, max_lon) of a track"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    return (float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max()))
+
+
+def _bbox_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class CircleRegion:
+    """Points within radius_km of a center"""
+
+    def __init__(self, center_lat, center_lon, radius_km):
+        self.center_lat = center_lat
+        self.center_lon = center_lon
+        self.radius_km = radius_km
+        dlat = radius_km / KM_PER_DEGREE
+        max_lat = min(abs(center_lat) + dlat, 90.0)
+        if max_lat >= 90.0:
+            dlon = 180.0
+        else:
+            dlon = min(radius_km / (KM_PER_DEGREE * math.cos(math.radians(max_lat))), 180.0)
+        self.bbox = (center_lat - dlat, center_lon - dlon, center_lat + dlat, center_lon + dlon)
+
+    def contains(self, lat, lon):
+        """Boolean mask of the points inside the circle"""
+        return haversine(lat, lon, self.center_lat, self.center_lon) <= self.radius_km
+
+
+class PolygonRegion:
+    """Points inside a polygon given as a list of (lat, lon) vertices"""
+
+    def __init__(self, vertices):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        if vertices.ndim != 2 or vertices.shape[0] < 3:
+            raise ValueError("A polygon region needs at least 3 (lat, lon) vertices")
+        self.lat = vertices[:, 0]
+        self.lon = vertices[:, 1]
+        self.bbox = track_bbox(self.lat, self.lon)
+
+    def contains(self, lat, lon):
+        """Boolean mask of the points inside the polygon (even-odd rule)"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        inside = np.zeros(lat.shape, dtype=bool)
+        vlat0, vlon0 = self.lat[-1], self.lon[-1]
+        for vlat1, vlon1 in zip(self.lat, self.lon):
+            if vlat1 != vlat0:
+                crosses = (vlat1 > lat) != (vlat0 > lat)
+                lon_cross = vlon1 + (lat - vlat1) * (vlon0 - vlon1) / (vlat0 - vlat1)
+                inside ^= crosses & (lon < lon_cross)
+            vlat0, vlon0 = vlat1, vlon1
+        return inside
+
+
+class GeoFilter:
+    """
+    Keep tracks that pass through at least one region.
+
+    Tracks are first rejected by comparing their bounding box with each
+    region's; only the points inside a region's box get an exact test.
+    """
+
+    def __init__(self, regions):
+        self.regions = list(regions)
+
+    def matches(self, lat, lon, bbox=None):
+        """
+        Args:
+            lat, lon: Track coordinates (arrays)
+            bbox: Precomputed track_bbox, if available
+
+        Returns:
+            bool: True if any point of the track is in any region
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if lat.size == 0:
+            return False
+        if bbox is None:
+            bbox = track_bbox(lat, lon)
+        for region in self.regions:
+            if not _bbox_overlap(bbox, region.bbox):
+                continue
+            b = region.bbox
+            candidates = (lat >= b[0]) & (lat <= b[2]) & (lon >= b[1]) & (lon <= b[3])
+            if candidates.any() and region.contains(lat[candidates], lon[candidates]).any():
+                return True
+        return False
+
+
+def decode_polyline(encoded, precision=5):
+    """
+    Decode an encoded polyline (Google format, as in Strava's
+    map.summary_polyline) without a per-character loop
+
+    Returns:
+        np.ndarray: (n, 2) float64 lat/lon in degrees
+    """
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if chunks.size == 0:
+        return np.empty((0, 2))
+    # Each value is a run of 5-bit chunks, the last one without the 0x20 bit
+    ends = (chunks & 0x20) == 0
+    value_index = np.concatenate(([0], np.cumsum(ends)[:-1]))
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    shifts = 5 * (np.arange(chunks.size) - starts[value_index])
+    values = np.bincount(value_index, weights=(chunks & 0x1f) << shifts).astype(np.int64)
+    # Zigzag sign, then deltas to coordinates
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    values = values[:len(values) // 2 * 2].reshape(-1, 2)
+    return np.cumsum(values, axis=0) / 10.0 ** precision
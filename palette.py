@@ -0,0 +1,155 @@
+# palette.py
+# -*- coding: utf-8 -*-
+"""
+Course colours, computed for all the drawn activities at once.
+
+A colormap turns the list of courses kept after filtering into a lookup
+table of RGB colours, one row per course; the drawing loop only indexes it.
+Gradient colormaps spread a per-course value (position, date, distance)
+over a hue ramp, categorical ones map a per-course key (activity type) to
+fixed colours.
+"""
+import numpy as np
+
+# Hue ramp of the original green_shade: blue (230°) to purple (270°) at
+# mid-course, then to green (120°)
+DEFAULT_HUES = ((0.0, 0.5, 1.0), (230, 270, 120))
+
+
+def hsv_to_rgb(h, s, v):
+    """Vectorized colorsys.hsv_to_rgb: arrays in [0, 1] -> (n, 3) float array"""
+    h, s, v = np.broadcast_arrays(np.asarray(h, dtype=np.float64),
+                                  np.asarray(s, dtype=np.float64),
+                                  np.asarray(v, dtype=np.float64))
+    i = np.floor(h * 6.0)
+    f = h * 6.0 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i.astype(np.int64) % 6
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    rgb = np.stack([r, g, b], axis=-1)
+    # colorsys returns (v, v, v) for a grey
+    return np.where((s == 0)[..., None], v[..., None], rgb)
+
+
+def gradient_colors(t, hues=DEFAULT_HUES, saturation=0.65, brightness=0.5):
+    """
+    Colours of positions t in [0, 1] along a hue ramp
+
+    Args:
+        t: Array of positions
+        hues: (positions, hues in degrees) stops of the ramp
+
+    Returns:
+        np.ndarray: (n, 3) uint8 colours
+    """
+    t = np.clip(np.asarray(t, dtype=np.float64), 0.0, 1.0)
+    h = np.interp(t, hues[0], hues[1]) / 360
+    return (hsv_to_rgb(h, saturation, brightness) * 255).astype(np.uint8)
+
+
+class GradientColormap:
+    """Spread a numeric value of each course over a hue ramp"""
+
+    def __init__(self, key, hues=DEFAULT_HUES, saturation=0.65, brightness=0.5):
+        """
+        Args:
+            key: Callable (courses, start_index) -> float array, one
+                value per course
+            hues, saturation, brightness: See gradient_colors
+        """
+        self.key = key
+        self.hues = hues
+        self.saturation = saturation
+        self.brightness = brightness
+
+    def table(self, courses, domain=None, start_index=0):
+        """
+        Args:
+            courses: Courses to colour, in drawing order
+            domain: (min, max) of the value mapped to the ends of the ramp
+                (default: range of the values of courses)
+            start_index: Position of courses[0] among all drawn courses
+
+        Returns:
+            tuple: ((n, 3) uint8 table, domain used)
+        """
+        values = np.asarray(self.key(courses, start_index), dtype=np.float64)
+        if domain is None:
+            domain = (float(values.min()), float(values.max())) if values.size else (0.0, 0.0)
+        low, high = domain
+        t = (values - low) / (high - low) if high > low else np.zeros_like(values)
+        return gradient_colors(t, self.hues, self.saturation, self.brightness), tuple(domain)
+
+
+class CategoricalColormap:
+    """Fixed colour per category (e.g. activity type)"""
+
+    def __init__(self, key, colors, default=(128, 128, 128)):
+        """
+        Args:
+            key: Callable course -> category
+            colors: Dict category -> RGB colour
+            default: Colour of the categories not in colors
+        """
+        self.key = key
+        self.colors = colors
+        self.default = default
+
+    def table(self, courses, domain=None, start_index=0):
+        """Same interface as GradientColormap.table; the domain is unused"""
+        lut = np.array([self.default] + list(self.colors.values()), dtype=np.uint8)
+        codes = {category: k + 1 for k, category in enumerate(self.colors)}
+        index = np.array([codes.get(self.key(course), 0) for course in courses], dtype=np.int64)
+        return lut[index], domain
+
+
+# Activity types as written by FIT files, GPX exports and Strava
+SPORT_COLORS = {
+    "running": (230, 110, 20),
+    "run": (230, 110, 20),
+    "trail_running": (170, 70, 20),
+    "trailrun": (170, 70, 20),
+    "cycling": (30, 90, 200),
+    "ride": (30, 90, 200),
+    "biking": (30, 90, 200),
+    "walking": (40, 150, 60),
+    "walk": (40, 150, 60),
+    "hiking": (20, 100, 40),
+    "hike": (20, 100, 40),
+    "swimming": (20, 170, 190),
+    "swim": (20, 170, 190),
+}
+
+COLORMAPS = {
+    # Position among the drawn courses (the original gradient)
+    "index": GradientColormap(lambda courses, start: start + np.arange(len(courses))),
+    "date": GradientColormap(lambda courses, start: [c.start_time.timestamp() for c in courses]),
+    "distance": GradientColormap(lambda courses, start: [c.distance_km for c in courses]),
+    "type": CategoricalColormap(lambda course: course.sport, SPORT_COLORS),
+}
+
+
+def color_table(courses, colormap="index", domain=None, start_index=0):
+    """
+    Colour lookup table of courses
+
+    Args:
+        colormap: Name in COLORMAPS, or an object with the same table()
+            method
+        domain, start_index: Fix the scale to the one of a previous render
+            (see GradientColormap.table). Values outside the domain are
+            clipped to the ends of the ramp, so a domain fixed from earlier
+            courses gives every later, larger value the same last colour
+
+    Returns:
+        tuple: ((n, 3) uint8 table, domain used)
+    """
+    if isinstance(colormap, str):
+        if colormap not in COLORMAPS:
+            raise ValueError(f"Unknown colormap {colormap!r}, expected one of {sorted(COLORMAPS)}")
+        colormap = COLORMAPS[colormap]
+    return colormap.table(courses, domain, start_index)
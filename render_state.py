@@ -0,0 +1,203 @@
+# render_state.py
+# -*- coding: utf-8 -*-
+"""
+Checkpoint of a rendered video, so that a later run only draws and encodes
+the activities added since.
+
+The checkpoint holds the supersampled cumulative canvas, the distance
+counter, the IDs of the activities already processed, the video-only
+segments encoded so far and the last frame (shown by the final hold). A new
+run appends one segment; the output video is rebuilt by joining the
+segments without re-encoding them.
+"""
+import datetime
+import json
+import os
+import numpy as np
+from PIL import Image
+from frame_encoder import FrameEncoder, concat_videos
+
+STATE_FILE = "state.json"
+STATE_VERSION = 1
+
+
+class RenderCheckpoint:
+    """
+    Render state stored in a folder.
+
+    Files are numbered by generation and state.json, written last and
+    atomically, names the current ones: an interrupted run leaves the
+    previous checkpoint usable.
+    """
+
+    def __init__(self, folder, params):
+        """
+        Args:
+            folder: Checkpoint folder
+            params: JSON-serialisable render settings (map, size, speed...);
+                a checkpoint saved with other settings is discarded
+        """
+        self.folder = folder
+        self.params = params
+        os.makedirs(folder, exist_ok=True)
+        self.state = self._load()
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _empty_state(self):
+        return {
+            "version": STATE_VERSION,
+            "params": self.params,
+            "generation": 0,
+            "distance_accum": 0.0,
+            "processed": [],
+            "last_start_time": None,
+            "color_domain": None,
+            "color_offset": 0,
+            "source_frames": 0,
+            "segments": [],
+            "canvas": None,
+            "tail_frame": None,
+        }
+
+    def _load(self):
+        try:
+            with open(self._path(STATE_FILE)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return self._empty_state()
+        if state.get("version") != STATE_VERSION or state.get("params") != self.params:
+            print("Render checkpoint was made with other settings, rendering from scratch")
+            self.reset()
+            return self._empty_state()
+        files = state["segments"] + [state["canvas"], state["tail_frame"]]
+        if not all(name and os.path.exists(self._path(name)) for name in files):
+            print("Render checkpoint is incomplete, rendering from scratch")
+            self.reset()
+            return self._empty_state()
+        return state
+
+    def reset(self):
+        """Forget the checkpoint and remove its files"""
+        for name in os.listdir(self.folder):
+            if name == STATE_FILE or name.startswith(("segment_", "canvas_", "tail_", "hold")):
+                os.remove(self._path(name))
+        self.state = self._empty_state()
+
+    @property
+    def is_empty(self):
+        return self.state["canvas"] is None
+
+    @property
+    def processed(self):
+        """Set of activity IDs already drawn (or rejected by the filters)"""
+        return set(self.state["processed"])
+
+    @property
+    def distance_accum(self):
+        return self.state["distance_accum"]
+
+    @property
+    def last_start_time(self):
+        """Start time of the most recent activity drawn, or None"""
+        value = self.state["last_start_time"]
+        return datetime.datetime.fromisoformat(value) if value else None
+
+    @property
+    def color_domain(self):
+        """Scale of the colormap fixed by the first render (see palette.color_table)"""
+        domain = self.state["color_domain"]
+        return tuple(domain) if domain is not None else None
+
+    @property
+    def color_offset(self):
+        """Number of courses drawn so far, position of the next one for the colormap"""
+        return self.state["color_offset"]
+
+    @property
+    def source_frames(self):
+        """Source frames encoded so far (before the speed-up)"""
+        return self.state["source_frames"]
+
+    def canvas(self):
+        """Supersampled cumulative canvas, or None for an empty checkpoint"""
+        if self.is_empty:
+            return None
+        with Image.open(self._path(self.state["canvas"])) as image:
+            return image.convert("RGB")
+
+    def tail_frame(self):
+        """Last frame of the video (HxWx3 uint8), or None"""
+        if self.state["tail_frame"] is None:
+            return None
+        return np.array(Image.open(self._path(self.state["tail_frame"])).convert("RGB"))
+
+    def open_segment(self, size, fps, speed_factor):
+        """FrameEncoder writing the next video-only segment"""
+        name = f"segment_{self.state['generation'] + 1:04d}.mp4"
+        return FrameEncoder(self._path(name), size, fps=fps, speed_factor=speed_factor,
+                            source_offset=self.state["source_frames"])
+
+    def commit(self, canvas, distance_accum, processed, last_start_time, color_domain, color_offset,
+               encoder=None):
+        """
+        Record a finished run.
+
+        Args:
+            canvas: Supersampled cumulative canvas (PIL image)
+            processed: IDs of every activity handled so far
+            encoder: Closed FrameEncoder of the new segment, if any frame
+                was encoded
+        """
+        state = dict(self.state)
+        generation = state["generation"] + 1
+        previous = [state["canvas"], state["tail_frame"]]
+
+        if encoder is not None:
+            state["segments"] = state["segments"] + [os.path.basename(encoder.output_file)]
+            state["source_frames"] = encoder.source_count
+            if encoder.last_frame is not None:
+                state["tail_frame"] = f"tail_{generation:04d}.png"
+                Image.fromarray(encoder.last_frame).save(self._path(state["tail_frame"]))
+        state["canvas"] = f"canvas_{generation:04d}.png"
+        canvas.save(self._path(state["canvas"]))
+
+        state.update(
+            generation=generation,
+            distance_accum=distance_accum,
+            processed=sorted(processed),
+            last_start_time=last_start_time.isoformat() if last_start_time else None,
+            color_domain=list(color_domain) if color_domain is not None else None,
+            color_offset=color_offset,
+        )
+        tmp_path = self._path(f"{STATE_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(STATE_FILE))
+        self.state = state
+
+        for name in previous:
+            if name and name not in (state["canvas"], state["tail_frame"]):
+                os.remove(self._path(name))
+
+    def write_video(self, output_file, size, fps, speed_factor, hold_seconds=2, audio_file=None):
+        """
+        Join the segments, a short hold on the last frame and the music
+        into output_file. Only the hold is encoded.
+        """
+        segments = [self._path(name) for name in self.state["segments"]]
+        tail = self.tail_frame()
+        frame_count = 0
+        if tail is not None:
+            hold = FrameEncoder(self._path("hold.mp4"), size, fps=fps, speed_factor=speed_factor,
+                                source_offset=self.state["source_frames"])
+            hold.last_frame = tail
+            hold.hold(hold_seconds)
+            hold.close()
+            frame_count = hold.frame_count
+            segments.append(hold.output_file)
+        if not segments:
+            raise ValueError("No frames available")
+        duration = frame_count / fps if frame_count else None
+        return concat_videos(segments, output_file, audio_file=audio_file, duration=duration)
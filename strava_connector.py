@@ -4,14 +4,152 @@ Module pour se connecter à l'API Strava et télécharger les activités GPS
 """
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
 import time
 import json
-from datetime import datetime, timedelta
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from strava_store import parse_start_date
+from tracks import Track, write_npz_track
+from geo import decode_polyline
+
+STRAVA_API_URL = "https://www.strava.com/api/v3"
+STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
+
+# Fenêtres des limites Strava : 15 minutes et journée (remises à zéro aux
+# quarts d'heure et à minuit UTC)
+RATE_LIMIT_WINDOWS = (15 * 60, 24 * 3600)
+# Limites supposées tant qu'aucune réponse n'a donné les vraies
+DEFAULT_RATE_LIMITS = (100, 1000)
+
+# Délais (connexion, lecture) des requêtes HTTP en secondes
+DEFAULT_TIMEOUT = (5, 30)
+
+
+def create_session(pool_size=10, retries=3, backoff_factor=0.5):
+    """
+    Session HTTP réutilisant ses connexions (keep-alive), avec nouvelles
+    tentatives et délai croissant sur les erreurs de connexion et les
+    réponses 5xx transitoires. Les 429 sont laissées au RateLimiter.
+    Seules les méthodes idempotentes (GET...) sont renvoyées après une
+    erreur de lecture ou une 5xx : un POST de rafraîchissement du token
+    n'est jamais rejoué.
+
+    Args:
+        pool_size: Connexions gardées ouvertes par hôte
+        retries: Nouvelles tentatives au maximum
+        backoff_factor: Base du délai entre tentatives (0.5, 1, 2... s)
+
+    Returns:
+        requests.Session
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class RateLimiter:
+    """
+    Seau de jetons par fenêtre de limite Strava.
+
+    Chaque requête consomme un jeton dans chaque fenêtre ; les seaux sont
+    remplis à chaque remise à zéro de leur fenêtre et recalés sur les
+    en-têtes X-RateLimit-Limit / X-RateLimit-Usage de chaque réponse, en
+    réservant les requêtes encore en cours. Quand un seau est vide,
+    acquire() attend la fin de sa fenêtre.
+    """
+
+    def __init__(self, limits=DEFAULT_RATE_LIMITS, windows=RATE_LIMIT_WINDOWS,
+                 clock=time.time, sleep=time.sleep):
+        """
+        Args:
+            limits: Requêtes autorisées par fenêtre
+            windows: Durée des fenêtres en secondes
+            clock, sleep: Horloge et attente (remplaçables pour les tests)
+        """
+        self.limits = list(limits)
+        self.windows = list(windows)
+        self.tokens = list(limits)
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        now = clock()
+        self._resets = [self._next_reset(now, w) for w in self.windows]
+
+    @staticmethod
+    def _next_reset(now, window):
+        return (now // window + 1) * window
+
+    def _refill(self, now):
+        for k, window in enumerate(self.windows):
+            if now >= self._resets[k]:
+                self.tokens[k] = self.limits[k]
+                self._resets[k] = self._next_reset(now, window)
+
+    def acquire(self):
+        """Attend qu'une requête soit autorisée et consomme son jeton"""
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._refill(now)
+                empty = [k for k, tokens in enumerate(self.tokens) if tokens <= 0]
+                if not empty:
+                    self.tokens = [tokens - 1 for tokens in self.tokens]
+                    self._in_flight += 1
+                    return
+                wait = max(self._resets[k] for k in empty) - now
+            print(f"⏳ Limite Strava atteinte, attente de {int(wait) + 1} s")
+            self.sleep(max(wait, 0) + 1)
+
+    def update(self, headers):
+        """
+        Termine une requête obtenue par acquire() et recale les seaux sur
+        les en-têtes de limite de sa réponse (vides si elle a échoué)
+        """
+        limits = usages = []
+        limit = headers.get('X-RateLimit-Limit')
+        usage = headers.get('X-RateLimit-Usage')
+        if limit and usage:
+            try:
+                limits = [int(v) for v in limit.split(',')]
+                usages = [int(v) for v in usage.split(',')]
+            except ValueError:
+                limits = usages = []
+        with self._lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+            self._refill(self.clock())
+            for k in range(min(len(self.windows), len(limits), len(usages))):
+                self.limits[k] = limits[k]
+                self.tokens[k] = max(limits[k] - usages[k] - self._in_flight, 0)
+
+    def exhaust(self):
+        """Vide le seau de 15 minutes (après une réponse 429 sans en-têtes)"""
+        with self._lock:
+            self.tokens[0] = 0
+
 
 class StravaConnector:
     """Gère la connexion et le téléchargement des activités Strava"""
     
-    def __init__(self, client_id=None, client_secret=None, refresh_token=None):
+    def __init__(self, client_id=None, client_secret=None, refresh_token=None,
+                 base_url=STRAVA_API_URL, token_url=STRAVA_TOKEN_URL, rate_limiter=None,
+                 max_retries=5, pool_size=10, timeout=DEFAULT_TIMEOUT, retries=3,
+                 backoff_factor=0.5):
         """
         Initialise le connecteur Strava
         
@@ -19,6 +157,15 @@ class StravaConnector:
             client_id: ID client Strava API
             client_secret: Secret client Strava API
             refresh_token: Token de refresh pour l'authentification
+            base_url: URL de l'API (un serveur local de remplacement pour les tests)
+            token_url: URL de rafraîchissement du token
+            rate_limiter: RateLimiter partagé (optionnel)
+            max_retries: Nouvelles tentatives après une réponse 429
+            pool_size: Connexions HTTP gardées ouvertes (au moins le nombre
+                de téléchargements simultanés)
+            timeout: Délai (connexion, lecture) de chaque requête en secondes
+            retries: Nouvelles tentatives sur erreur de connexion ou 5xx
+            backoff_factor: Base du délai entre ces tentatives
         """
         self.client_id = client_id or os.environ.get('STRAVA_CLIENT_ID')
         self.client_secret = client_secret or os.environ.get('STRAVA_CLIENT_SECRET')
@@ -26,8 +173,49 @@ class StravaConnector:
         
         self.access_token = None
         self.token_expires_at = 0
-        
-        self.base_url = "https://www.strava.com/api/v3"
+        self._token_lock = threading.Lock()
+        
+        self.base_url = base_url
+        self.token_url = token_url
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        # Toutes les requêtes passent par la même session : les pages
+        # d'activités et les streams réutilisent quelques connexions TLS
+        self.session = create_session(pool_size, retries, backoff_factor)
+
+    def close(self):
+        """Ferme les connexions de la session"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _api_get(self, url, **kwargs):
+        """
+        GET sur l'API Strava, soumis à la limite de débit.
+        Sur une réponse 429, attend (Retry-After ou délai croissant) puis
+        recommence, au plus max_retries fois.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            response = None
+            try:
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+            finally:
+                self.rate_limiter.update(response.headers if response is not None else {})
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            if 'X-RateLimit-Usage' not in response.headers:
+                self.rate_limiter.exhaust()
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+            print(f"⏳ Strava a répondu 429, nouvelle tentative dans {delay:g} s")
+            self.rate_limiter.sleep(delay)
+        return response
     
     def get_access_token(self):
         """
@@ -36,30 +224,38 @@ class StravaConnector:
         Returns:
             str: Access token valide
         """
-        if self.access_token and time.time() < self.token_expires_at:
+        # Un seul rafraîchissement quand plusieurs threads téléchargent
+        with self._token_lock:
+            if self.access_token and time.time() < self.token_expires_at:
+                return self.access_token
+            
+            print("🔄 Rafraîchissement du token Strava...")
+            
+            payload = {
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'refresh_token': self.refresh_token,
+                'grant_type': 'refresh_token'
+            }
+            
+            # Pas de nouvelle tentative automatique : Strava peut avoir
+            # déjà renouvelé le refresh token si la réponse s'est perdue
+            try:
+                response = self.session.post(self.token_url, data=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                raise Exception(f"Erreur réseau lors du rafraîchissement du token: {e}") from e
+            
+            if response.status_code != 200:
+                raise Exception(f"Erreur lors du rafraîchissement du token: {response.text}")
+            
+            data = response.json()
+            self.access_token = data['access_token']
+            self.token_expires_at = data['expires_at']
+            # Strava peut renvoyer un nouveau refresh token
+            self.refresh_token = data.get('refresh_token', self.refresh_token)
+            
+            print("✅ Token obtenu avec succès")
             return self.access_token
-        
-        print("🔄 Rafraîchissement du token Strava...")
-        
-        url = "https://www.strava.com/oauth/token"
-        payload = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'refresh_token': self.refresh_token,
-            'grant_type': 'refresh_token'
-        }
-        
-        response = requests.post(url, data=payload)
-        
-        if response.status_code != 200:
-            raise Exception(f"Erreur lors du rafraîchissement du token: {response.text}")
-        
-        data = response.json()
-        self.access_token = data['access_token']
-        self.token_expires_at = data['expires_at']
-        
-        print("✅ Token obtenu avec succès")
-        return self.access_token
     
     def get_athlete_info(self):
         """
@@ -71,7 +267,7 @@ class StravaConnector:
         token = self.get_access_token()
         headers = {'Authorization': f'Bearer {token}'}
         
-        response = requests.get(f"{self.base_url}/athlete", headers=headers)
+        response = self._api_get(f"{self.base_url}/athlete", headers=headers)
         
         if response.status_code != 200:
             raise Exception(f"Erreur lors de la récupération des infos athlète: {response.text}")
@@ -104,7 +300,7 @@ class StravaConnector:
         if before:
             params['before'] = int(before)
         
-        response = requests.get(
+        response = self._api_get(
             f"{self.base_url}/athlete/activities",
             headers=headers,
             params=params
@@ -164,17 +360,16 @@ class StravaConnector:
         print(f"✅ Total: {len(all_activities)} activités récupérées")
         return all_activities
     
-    def download_activity_gpx(self, activity_id, output_folder, filename=None):
+    def get_streams(self, activity_id):
         """
-        Télécharge le fichier GPX d'une activité
+        Récupère les streams GPS d'une activité
         
         Args:
             activity_id: ID de l'activité
-            output_folder: Dossier de destination
-            filename: Nom du fichier (optionnel)
         
         Returns:
-            str: Chemin du fichier téléchargé ou None
+            dict: Streams par type (latlng, time, altitude), ou None si la
+            requête a échoué
         """
         token = self.get_access_token()
         headers = {'Authorization': f'Bearer {token}'}
@@ -185,42 +380,147 @@ class StravaConnector:
             'key_by_type': 'true'
         }
         
-        response = requests.get(url, headers=headers, params=params)
+        response = self._api_get(url, headers=headers, params=params)
         
         if response.status_code != 200:
             print(f"⚠️  Impossible de télécharger l'activité {activity_id}: {response.status_code}")
             return None
         
-        data = response.json()
+        return response.json()
+    
+    def download_activity_gpx(self, activity_id, output_folder, filename=None, start_time=None):
+        """
+        Télécharge le fichier GPX d'une activité
+        
+        Args:
+            activity_id: ID de l'activité
+            output_folder: Dossier de destination
+            filename: Nom du fichier (optionnel)
+            start_time: datetime de départ de l'activité (optionnel)
         
+        Returns:
+            str: Chemin du fichier téléchargé ou None
+        """
+        data = self.get_streams(activity_id)
+        if data is None or not self._has_gps(data, activity_id):
+            return None
+        
+        os.makedirs(output_folder, exist_ok=True)
+        filepath = os.path.join(output_folder, filename or f"strava_{activity_id}.gpx")
+        self._write_gpx(data, activity_id, filepath, start_time)
+        return filepath
+    
+    def download_activity_track(self, activity_id, output_folder, start_time=None, sport=None,
+                                export_gpx=False):
+        """
+        Télécharge une activité en track compacte (strava_<id>.npz), lue
+        directement par tracks.read_track sans parsing XML
+        
+        Args:
+            activity_id: ID de l'activité
+            output_folder: Dossier de destination
+            start_time: datetime de départ de l'activité (optionnel)
+            sport: Type d'activité Strava (ex: 'Run')
+            export_gpx: Écrire aussi strava_<id>.gpx à côté
+        
+        Returns:
+            str: Chemin du fichier .npz ou None
+        """
+        data = self.get_streams(activity_id)
+        if data is None:
+            return None
+        return self._save_streams(data, activity_id, output_folder, start_time, sport, export_gpx) or None
+    
+    @staticmethod
+    def _has_gps(data, activity_id):
         # Vérifier si on a des données GPS
         if 'latlng' not in data or not data['latlng'].get('data'):
             print(f"⚠️  Pas de données GPS pour l'activité {activity_id}")
-            return None
+            return False
+        return True
+    
+    def _save_streams(self, data, activity_id, output_folder, start_time=None, sport=None,
+                      export_gpx=False):
+        """
+        Enregistre les streams d'une activité en track .npz (et en GPX si
+        export_gpx)
+        
+        Returns:
+            str: Chemin du fichier .npz, ou '' si l'activité n'a pas de GPS
+        """
+        if not self._has_gps(data, activity_id):
+            return ''
         
-        # Créer le fichier GPX
         os.makedirs(output_folder, exist_ok=True)
+        filepath = os.path.join(output_folder, f"strava_{activity_id}.npz")
+        write_npz_track(filepath, self._track_from_streams(data, start_time, sport))
+        
+        if export_gpx:
+            self._write_gpx(data, activity_id, os.path.join(output_folder, f"strava_{activity_id}.gpx"),
+                            start_time)
+        return filepath
+    
+    @staticmethod
+    def _track_from_streams(streams, start_time=None, sport=None):
+        """
+        Convertit les streams Strava en tracks.Track
+        
+        Args:
+            streams: Données des streams Strava
+            start_time: datetime de départ ; sans lui, les points n'ont pas
+                de temps
+            sport: Type d'activité Strava
         
-        if not filename:
-            filename = f"strava_{activity_id}.gpx"
+        Returns:
+            Track
+        """
+        latlng = np.asarray(streams['latlng']['data'], dtype=np.float64).reshape(-1, 2)
+        n = len(latlng)
         
-        filepath = os.path.join(output_folder, filename)
+        # Les temps des streams sont des secondes depuis le départ
+        times = np.full(n, np.nan)
+        offsets = np.asarray(streams.get('time', {}).get('data', [])[:n], dtype=np.float64)
+        if start_time is not None:
+            start_time = start_time.astimezone(timezone.utc)
+            times[:len(offsets)] = start_time.timestamp() + offsets
         
-        # Générer le contenu GPX
-        gpx_content = self._create_gpx_from_streams(data, activity_id)
+        ele = np.full(n, np.nan, dtype=np.float32)
+        altitudes = [np.nan if a is None else a for a in streams.get('altitude', {}).get('data', [])[:n]]
+        ele[:len(altitudes)] = altitudes
         
+        return Track(start_time, latlng[:, 0], latlng[:, 1], times, ele, sport.lower() if sport else None)
+    
+    @staticmethod
+    def _track_from_polyline(polyline, start_time=None, sport=None):
+        """
+        Tracé simplifié d'une activité à partir de son summary_polyline
+        (points sans temps ni altitude)
+        
+        Returns:
+            Track, ou None si le polyline a moins de deux points
+        """
+        points = decode_polyline(polyline or '')
+        if len(points) < 2:
+            return None
+        n = len(points)
+        start_time = start_time.astimezone(timezone.utc) if start_time else None
+        return Track(start_time, points[:, 0], points[:, 1], np.full(n, np.nan),
+                     np.full(n, np.nan, dtype=np.float32), sport.lower() if sport else None)
+    
+    def _write_gpx(self, data, activity_id, filepath, start_time=None):
+        """Écrit les streams d'une activité dans un fichier GPX"""
+        gpx_content = self._create_gpx_from_streams(data, activity_id, start_time)
         with open(filepath, 'w') as f:
             f.write(gpx_content)
-        
-        return filepath
     
-    def _create_gpx_from_streams(self, streams, activity_id):
+    def _create_gpx_from_streams(self, streams, activity_id, start_time=None):
         """
         Crée un fichier GPX à partir des données de streams
         
         Args:
             streams: Données des streams Strava
             activity_id: ID de l'activité
+            start_time: datetime de départ (par défaut : maintenant)
         
         Returns:
             str: Contenu du fichier GPX
@@ -239,8 +539,8 @@ class StravaConnector:
         gpx.append(f'    <name>Activity {activity_id}</name>')
         gpx.append('    <trkseg>')
         
-        # Points GPS
-        base_time = datetime.now()
+        # Points GPS (les temps des streams sont relatifs au départ)
+        base_time = start_time.astimezone(timezone.utc).replace(tzinfo=None) if start_time else datetime.now()
         for i, (lat, lon) in enumerate(latlng):
             gpx.append('      <trkpt lat="{}" lon="{}">'.format(lat, lon))
             
@@ -264,9 +564,10 @@ class StravaConnector:
         return '\n'.join(gpx)
     
     def download_activities(self, output_folder, after=None, before=None, 
-                           activity_types=None, max_activities=None):
+                           activity_types=None, max_activities=None, workers=8, export_gpx=False):
         """
-        Télécharge plusieurs activités
+        Télécharge plusieurs activités en parallèle, au rythme permis par
+        les limites Strava (voir RateLimiter)
         
         Args:
             output_folder: Dossier de destination
@@ -274,9 +575,12 @@ class StravaConnector:
             before: datetime - activités avant cette date
             activity_types: list - types d'activités (ex: ['Run', 'Ride'])
             max_activities: int - nombre maximum d'activités à télécharger
+            workers: int - téléchargements simultanés
+            export_gpx: bool - écrire aussi un GPX par activité
         
         Returns:
-            list: Liste des fichiers téléchargés
+            list: Liste des fichiers .npz téléchargés, dans l'ordre des
+            activités
         """
         activities = self.get_all_activities(
             after=after,
@@ -289,29 +593,124 @@ class StravaConnector:
         
         print(f"\n📥 Téléchargement de {len(activities)} activités...")
         
-        downloaded_files = []
-        
-        for i, activity in enumerate(activities, 1):
-            activity_id = activity['id']
-            activity_name = activity.get('name', 'Unnamed')
-            activity_date = activity.get('start_date', '')
-            
-            print(f"   [{i}/{len(activities)}] {activity_name} ({activity_date[:10]})")
-            
-            filepath = self.download_activity_gpx(
-                activity_id,
-                output_folder,
-                filename=f"strava_{activity_id}.gpx"
-            )
-            
-            if filepath:
-                downloaded_files.append(filepath)
-            
-            # Respect des limites de l'API (100 requêtes / 15 min)
-            time.sleep(0.2)
+        # Token obtenu une fois avant de lancer les threads
+        self.get_access_token()
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {
+                executor.submit(
+                    self.download_activity_track,
+                    activity['id'],
+                    output_folder,
+                    start_time=parse_start_date(activity.get('start_date')),
+                    sport=activity.get('type'),
+                    export_gpx=export_gpx
+                ): i
+                for i, activity in enumerate(activities)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                activity = activities[i]
+                activity_name = activity.get('name', 'Unnamed')
+                activity_date = activity.get('start_date', '')
+                print(f"   [{done}/{len(activities)}] {activity_name} ({activity_date[:10]})")
+                results[i] = future.result()
+        
+        downloaded_files = [results[i] for i in sorted(results) if results[i]]
         
         print(f"\n✅ {len(downloaded_files)} fichiers téléchargés avec succès!")
         return downloaded_files
+    
+    def sync_activities(self, store, after=None, before=None, activity_types=None,
+                        max_activities=None, workers=8, export_gpx=False, preview=False):
+        """
+        Synchronise un ActivityStore puis renvoie les fichiers de la période.
+        
+        Seules les activités parties après la plus récente déjà indexée
+        sont listées (toute la période si elle commence avant ce que
+        l'index couvre), et seuls les streams jamais téléchargés sont
+        demandés : un nouveau rendu ne coûte presque aucun appel API.
+        
+        Args:
+            store: ActivityStore de l'athlète
+            after: datetime - activités après cette date
+            before: datetime - activités avant cette date
+            activity_types: list - types d'activités (ex: ['Run', 'Ride'])
+            max_activities: int - nombre maximum d'activités
+            workers: int - téléchargements simultanés
+            export_gpx: bool - écrire aussi un GPX par activité
+            preview: bool - aucun stream téléchargé : renvoie les tracés
+                simplifiés des summary_polyline, pour un aperçu rapide
+        
+        Returns:
+            list: Fichiers de streams (ou d'aperçu) des activités de la
+            période, dans l'ordre chronologique
+        """
+        after_ts = int(after.timestamp()) if after else 0
+        before_ts = int(before.timestamp()) if before else None
+        
+        # Liste des activités : seulement ce que l'index ne connaît pas
+        synced_from = store.synced_from
+        if synced_from is not None and after_ts >= synced_from:
+            since = store.last_start_ts() or synced_from
+        else:
+            since = after_ts
+        new_activities = self.get_all_activities(
+            after=datetime.fromtimestamp(since, tz=timezone.utc) if since else None
+        )
+        store.add_activities(new_activities)
+        store.synced_from = min(after_ts, synced_from) if synced_from is not None else after_ts
+        
+        rows = store.select(after_ts, before_ts, activity_types, max_activities)
+        if preview:
+            return self._write_previews(store, rows)
+        
+        missing = [row for row in rows if row['stream_file'] is None]
+        print(f"\n📦 {len(rows)} activités dans la période, {len(missing)} à télécharger")
+        
+        def fetch(row):
+            data = self.get_streams(row['id'])
+            if data is None:
+                return None  # échec : redemandé au prochain sync
+            path = self._save_streams(data, row['id'], store.streams_dir,
+                                      parse_start_date(row['start_date']), row['type'], export_gpx)
+            return os.path.basename(path)
+        
+        if missing:
+            self.get_access_token()
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = {executor.submit(fetch, row): row for row in missing}
+                for done, future in enumerate(as_completed(futures), 1):
+                    row = futures[future]
+                    print(f"   [{done}/{len(missing)}] {row['name']} ({(row['start_date'] or '')[:10]})")
+                    filename = future.result()
+                    if filename is not None:
+                        store.set_stream_file(row['id'], filename)
+        
+        rows = store.select(after_ts, before_ts, activity_types, max_activities)
+        files = [store.stream_path(row['stream_file']) for row in rows if row['stream_file']]
+        print(f"✅ {len(files)} activités disponibles localement")
+        return files
+    
+    def _write_previews(self, store, rows):
+        """
+        Écrit le tracé simplifié de chaque activité dans store.previews_dir
+        
+        Returns:
+            list: Fichiers .npz des activités avec GPS, dans l'ordre de rows
+        """
+        files = []
+        for row in rows:
+            track = self._track_from_polyline(row['summary_polyline'], parse_start_date(row['start_date']),
+                                              row['type'])
+            if track is None:
+                continue
+            filepath = os.path.join(store.previews_dir, f"strava_{row['id']}.npz")
+            write_npz_track(filepath, track)
+            files.append(filepath)
+        print(f"👀 Aperçu : {len(files)} tracés simplifiés, aucun stream téléchargé")
+        return files
 
 
 def get_strava_auth_url(client_id, redirect_uri="http://localhost:8501"):
@@ -355,7 +754,7 @@ def exchange_code_for_token(client_id, client_secret, code):
         'grant_type': 'authorization_code'
     }
     
-    response = requests.post(url, data=payload)
+    response = requests.post(url, data=payload, timeout=DEFAULT_TIMEOUT)
     
     if response.status_code != 200:
         raise Exception(f"Erreur lors de l'échange du code: {response.text}")
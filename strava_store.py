@@ -0,0 +1,161 @@
+# strava_store.py
+"""
+Stockage local et persistant des activités Strava d'un athlète : un index
+SQLite des métadonnées et les fichiers de streams déjà téléchargés, pour
+qu'une synchronisation ne redemande que ce qui est nouveau.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    start_date TEXT,
+    start_ts INTEGER,
+    distance REAL,
+    summary_polyline TEXT,
+    data TEXT,
+    -- NULL : streams pas encore téléchargés ; '' : activité sans GPS
+    stream_file TEXT
+);
+CREATE INDEX IF NOT EXISTS activities_start ON activities (start_ts);
+CREATE TABLE IF NOT EXISTS sync (
+    key TEXT PRIMARY KEY,
+    value REAL
+);
+"""
+
+
+def parse_start_date(value):
+    """Date ISO Strava ("2025-03-01T08:00:00Z") -> datetime UTC, ou None"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class ActivityStore:
+    """
+    Activités d'un athlète : index SQLite (activities.db), dossier
+    streams/ des fichiers téléchargés et previews/ des tracés simplifiés,
+    sous root/<athlete_id>/.
+    """
+
+    def __init__(self, root, athlete_id):
+        """
+        Args:
+            root: Dossier racine des données Strava
+            athlete_id: ID Strava de l'athlète
+        """
+        self.folder = os.path.join(root, str(athlete_id))
+        self.streams_dir = os.path.join(self.folder, "streams")
+        self.previews_dir = os.path.join(self.folder, "previews")
+        os.makedirs(self.streams_dir, exist_ok=True)
+        os.makedirs(self.previews_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.folder, "activities.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get(self, key):
+        row = self._db.execute("SELECT value FROM sync WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set(self, key, value):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO sync (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def synced_from(self):
+        """Timestamp depuis lequel la liste des activités est complète, ou None"""
+        return self._get("synced_from")
+
+    @synced_from.setter
+    def synced_from(self, value):
+        self._set("synced_from", value)
+
+    def last_start_ts(self):
+        """Timestamp de départ de l'activité la plus récente, ou None"""
+        return self._db.execute("SELECT MAX(start_ts) AS ts FROM activities").fetchone()["ts"]
+
+    def add_activities(self, activities):
+        """
+        Ajoute ou met à jour des activités (résumés renvoyés par
+        /athlete/activities) sans perdre leurs streams déjà téléchargés
+        """
+        rows = []
+        for activity in activities:
+            start = parse_start_date(activity.get("start_date"))
+            rows.append((
+                activity["id"],
+                activity.get("name"),
+                activity.get("type"),
+                activity.get("start_date"),
+                int(start.timestamp()) if start else None,
+                activity.get("distance"),
+                (activity.get("map") or {}).get("summary_polyline"),
+                json.dumps(activity),
+            ))
+        with self._lock, self._db:
+            self._db.executemany(
+                """
+                INSERT INTO activities (id, name, type, start_date, start_ts, distance, summary_polyline, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    name = excluded.name, type = excluded.type, start_date = excluded.start_date,
+                    start_ts = excluded.start_ts, distance = excluded.distance,
+                    summary_polyline = excluded.summary_polyline, data = excluded.data
+                """,
+                rows,
+            )
+
+    def select(self, after=None, before=None, activity_types=None, limit=None):
+        """
+        Activités de la période, de la plus ancienne à la plus récente
+
+        Args:
+            after, before: Timestamps Unix des bornes (optionnels)
+            activity_types: Types à garder (ex: ['Run', 'Ride'])
+            limit: Nombre maximum d'activités
+
+        Returns:
+            list: sqlite3.Row (id, name, type, start_date, stream_file...)
+        """
+        query = "SELECT * FROM activities WHERE 1 = 1"
+        params = []
+        if after is not None:
+            query += " AND start_ts >= ?"
+            params.append(int(after))
+        if before is not None:
+            query += " AND start_ts <= ?"
+            params.append(int(before))
+        if activity_types:
+            query += f" AND type IN ({', '.join('?' * len(activity_types))})"
+            params.extend(activity_types)
+        query += " ORDER BY start_ts, id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return self._db.execute(query, params).fetchall()
+
+    def set_stream_file(self, activity_id, filename):
+        """Enregistre le fichier de streams d'une activité ('' si pas de GPS)"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE activities SET stream_file = ? WHERE id = ?", (filename, activity_id))
+
+    def stream_path(self, filename):
+        return os.path.join(self.streams_dir, filename)
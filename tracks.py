@@ -0,0 +1,443 @@
+# tracks.py
+# -*- coding: utf-8 -*-
+"""
+Single-pass GPS track readers and parallel activity ingestion.
+
+Each activity file is decoded once and returned as a Track holding the start
+time and compact NumPy arrays. Activities older than a date limit are
+rejected from the first timestamp, without decoding the whole track.
+Tracks can also be stored as compact .npz files (see write_npz_track), read
+without any parsing.
+"""
+import datetime
+import hashlib
+import io
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import gpxpy
+import fitdecode
+from geo import track_distances, track_bbox
+
+# start_time: timezone-aware datetime of the first timestamped point
+# lat, lon: float64 degrees; time: float64 Unix seconds (NaN if missing);
+# ele: float32 metres (NaN if missing); sport: activity type as written in
+# the file ("running", "cycling"...), or None
+Track = namedtuple("Track", ["start_time", "lat", "lon", "time", "ele", "sport"], defaults=(None,))
+
+# A filtered, subsampled activity ready to be drawn.
+# index: position in the sorted file list; points: (n, 2) lat/lon of the
+# drawn points; cumulative: km from the start at each drawn point;
+# distance_km: length of the full-resolution track; sport: see Track
+Course = namedtuple("Course", ["index", "start_time", "points", "cumulative", "distance_km", "sport"],
+                    defaults=(None,))
+
+FIT_SEMICIRCLE = 180 / 2**31
+
+# How much of a GPX file is scanned for the first point timestamp
+GPX_HEADER_BYTES = 64 * 1024
+_GPX_FIRST_TIME = re.compile(rb"<trkpt\b.*?<time>\s*([^<\s]+)\s*</time>", re.S)
+
+# Compact .npz tracks: lat/lon float32 degrees, time int32 seconds from
+# start_time (NPZ_NO_TIME where missing), ele float32 metres
+NPZ_NO_TIME = np.iinfo(np.int32).min
+
+
+def _as_utc(dt):
+    if dt is not None and dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+
+def _is_too_old(start_time, start_date_limit):
+    return start_date_limit is not None and start_time is not None and start_time < start_date_limit
+
+
+def _make_track(start_time, lat, lon, times, ele, sport=None):
+    return Track(
+        start_time,
+        np.asarray(lat, dtype=np.float64),
+        np.asarray(lon, dtype=np.float64),
+        np.asarray(times, dtype=np.float64),
+        np.asarray(ele, dtype=np.float32),
+        str(sport).lower() if sport else None,
+    )
+
+
+def peek_gpx_start_time(filepath):
+    """
+    Read the first track point timestamp from the head of a GPX file,
+    without parsing the XML. Returns None if it is not found there.
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(GPX_HEADER_BYTES)
+    match = _GPX_FIRST_TIME.search(head)
+    if not match:
+        return None
+    try:
+        return _as_utc(datetime.datetime.fromisoformat(match.group(1).decode().replace("Z", "+00:00")))
+    except ValueError:
+        return None
+
+
+def read_gpx_track(filepath, start_date_limit=None):
+    """
+    Read a GPX file in a single parse
+
+    Returns:
+        Track, or None if the activity starts before start_date_limit
+    """
+    if start_date_limit is not None and _is_too_old(peek_gpx_start_time(filepath), start_date_limit):
+        return None
+
+    with open(filepath, "r") as f:
+        gpx = gpxpy.parse(f)
+    start_time = None
+    sport = None
+    lat, lon, times, ele = [], [], [], []
+    for track in gpx.tracks:
+        sport = sport or track.type
+        for seg in track.segments:
+            for p in seg.points:
+                t = _as_utc(p.time)
+                if start_time is None and t is not None:
+                    start_time = t
+                lat.append(p.latitude)
+                lon.append(p.longitude)
+                times.append(t.timestamp() if t is not None else np.nan)
+                ele.append(p.elevation if p.elevation is not None else np.nan)
+    if _is_too_old(start_time, start_date_limit):
+        return None
+    return _make_track(start_time, lat, lon, times, ele, sport)
+
+
+def read_fit_track(filepath, start_date_limit=None):
+    """
+    Read a FIT file in a single decode. Decoding stops at the first record
+    timestamp if the activity starts before start_date_limit.
+
+    Returns:
+        Track, or None if the activity starts before start_date_limit
+    """
+    start_time = None
+    sport = None
+    lat, lon, times, ele = [], [], [], []
+    with fitdecode.FitReader(filepath) as fit:
+        for frame in fit:
+            if not isinstance(frame, fitdecode.FitDataMessage):
+                continue
+            if frame.name in ("sport", "session") and sport is None:
+                sport = frame.get_value("sport", fallback=None)
+                continue
+            if frame.name != "record":
+                continue
+            ts = _as_utc(frame.get_value("timestamp", fallback=None))
+            if start_time is None and ts:
+                start_time = ts
+                if _is_too_old(start_time, start_date_limit):
+                    return None
+            plat = frame.get_value("position_lat", fallback=None)
+            plon = frame.get_value("position_long", fallback=None)
+            if plat is None or plon is None:
+                continue
+            plat = plat * FIT_SEMICIRCLE
+            plon = plon * FIT_SEMICIRCLE
+            if not (-90 <= plat <= 90 and -180 <= plon <= 180):
+                continue
+            alt = frame.get_value("enhanced_altitude", fallback=None)
+            if alt is None:
+                alt = frame.get_value("altitude", fallback=None)
+            lat.append(plat)
+            lon.append(plon)
+            times.append(ts.timestamp() if ts else np.nan)
+            ele.append(alt if alt is not None else np.nan)
+    return _make_track(start_time, lat, lon, times, ele, sport)
+
+
+def _save_npz(path, track, **arrays):
+    """
+    Write the start time and sport of track plus arrays to an .npz file,
+    atomically (concurrent writers never leave a partial file)
+    """
+    start_time = track.start_time.timestamp() if track.start_time is not None else np.nan
+    buffer = io.BytesIO()
+    np.savez(buffer, start_time=np.float64(start_time), sport=np.str_(track.sport or ""), **arrays)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+def _load_npz_header(data):
+    """(start timestamp or NaN, start_time or None, sport or None) of an .npz written by _save_npz"""
+    ts = float(data["start_time"])
+    start_time = None if np.isnan(ts) else datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc)
+    return ts, start_time, str(data["sport"]) or None
+
+
+def write_npz_track(filepath, track):
+    """
+    Save a Track as a compact .npz file, written atomically. float32
+    degrees keep the positions to about a metre.
+    """
+    start = track.start_time.timestamp() if track.start_time is not None else np.nan
+    times = np.asarray(track.time, dtype=np.float64)
+    offsets = np.full(len(times), NPZ_NO_TIME, dtype=np.int32)
+    known = ~np.isnan(times)
+    if not np.isnan(start):
+        offsets[known] = np.round(times[known] - start).astype(np.int32)
+    _save_npz(filepath, track, lat=np.asarray(track.lat, dtype=np.float32),
+              lon=np.asarray(track.lon, dtype=np.float32), time=offsets,
+              ele=np.asarray(track.ele, dtype=np.float32))
+
+
+def read_npz_track(filepath, start_date_limit=None):
+    """
+    Read a track saved by write_npz_track. The start time is read first,
+    so old activities are rejected without loading their arrays.
+
+    Returns:
+        Track, or None if the activity starts before start_date_limit
+    """
+    with np.load(filepath) as data:
+        ts, start_time, sport = _load_npz_header(data)
+        if _is_too_old(start_time, start_date_limit):
+            return None
+        offsets = data["time"]
+        times = np.where(offsets == NPZ_NO_TIME, np.nan, ts + offsets.astype(np.float64))
+        return _make_track(start_time, data["lat"], data["lon"], times, data["ele"], sport)
+
+
+def read_track(filepath, start_date_limit=None):
+    """
+    Read a .gpx, .fit or .npz file, dispatching on the extension
+
+    Returns:
+        Track, or None if the format is unknown or the activity starts
+        before start_date_limit
+    """
+    ext = filepath.split(".")[-1].lower()
+    if ext == "gpx":
+        return read_gpx_track(filepath, start_date_limit)
+    if ext == "fit":
+        return read_fit_track(filepath, start_date_limit)
+    if ext == "npz":
+        return read_npz_track(filepath, start_date_limit)
+    return None
+
+
+class TrackCache:
+    """
+    On-disk cache of decoded tracks, one .npz per activity. Unlike
+    write_npz_track files, entries keep the decoded float64 arrays, so a
+    cache hit gives exactly the track a fresh decode would.
+
+    Entries are keyed either by path, size and modification time ("stat",
+    no read needed) or by a hash of the file content ("content", survives
+    renames and re-downloads). A changed file gets a new key, so stale
+    entries are never returned; prune() removes them once they are unused
+    for max_age_days or the cache outgrows max_bytes (least recently used
+    first, a hit refreshes the entry's modification time).
+    """
+
+    def __init__(self, cache_dir, key="stat", max_bytes=200 * 1024 * 1024, max_age_days=30):
+        if key not in ("stat", "content"):
+            raise ValueError(f"Unknown cache key {key!r}, expected 'stat' or 'content'")
+        self.cache_dir = cache_dir
+        self.key = key
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, filepath):
+        """Cache key of a file in its current state"""
+        if self.key == "content":
+            digest = hashlib.sha1()
+            with open(filepath, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        st = os.stat(filepath)
+        raw = f"{os.path.abspath(filepath)}|{st.st_size}|{st.st_mtime_ns}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, filepath, key=None):
+        """
+        Returns:
+            tuple: (Track, bbox) from the cache, or None on a miss
+        """
+        path = self._entry_path(key or self.key_for(filepath))
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                _, start_time, sport = _load_npz_header(data)
+                track = Track(start_time, data["lat"], data["lon"], data["time"], data["ele"], sport)
+                bbox = tuple(float(v) for v in data["bbox"])
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)  # marks the entry as recently used
+        except OSError:
+            pass
+        return track, bbox
+
+    def save(self, filepath, track, key=None):
+        """Store a decoded track; returns its bounding box"""
+        bbox = track_bbox(track.lat, track.lon) if len(track.lat) else (np.nan,) * 4
+        _save_npz(self._entry_path(key or self.key_for(filepath)), track, lat=track.lat, lon=track.lon,
+                  time=track.time, ele=track.ele, bbox=np.asarray(bbox, dtype=np.float64))
+        return bbox
+
+    def prune(self):
+        """
+        Remove entries unused for max_age_days, then the least recently
+        used ones until the cache fits in max_bytes
+
+        Returns:
+            int: Number of entries removed
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        oldest = datetime.datetime.now().timestamp() - self.max_age_days * 86400
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if mtime >= oldest and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def read(self, filepath, start_date_limit=None):
+        """
+        read_track through the cache. Activities rejected by the date
+        limit are not cached, since rejecting them only reads their head.
+
+        Returns:
+            tuple: (Track, bbox), or (None, None) if rejected
+        """
+        key = self.key_for(filepath)
+        cached = self.load(filepath, key)
+        if cached is not None:
+            track, bbox = cached
+            if _is_too_old(track.start_time, start_date_limit):
+                return None, None
+            return track, bbox
+        track = read_track(filepath, start_date_limit)
+        if track is None:
+            return None, None
+        return track, self.save(filepath, track, key)
+
+
+def interpolate_indices(n_points, max_points):
+    """Indices of at most max_points points spread evenly along a track"""
+    if n_points <= max_points:
+        return list(range(n_points))
+    if max_points == 1:
+        return [0]
+    return [int(i*(n_points-1)/(max_points-1)) for i in range(max_points)]
+
+
+def load_course(index, filepath, start_date_limit=None, geofilter=None, max_points=120, cache_dir=None):
+    """
+    Read, date-filter, geofilter and subsample one activity
+
+    Args:
+        cache_dir: Optional TrackCache folder, so unchanged files are not decoded again
+
+    Returns:
+        tuple: (Course, None) for a kept activity, (None, None) for one
+        rejected by the date or geo filters, (None, error message) for a
+        file that could not be read
+    """
+    bbox = None
+    try:
+        # A .npz track is already as fast to read as a cache entry
+        if cache_dir and not filepath.lower().endswith(".npz"):
+            track, bbox = TrackCache(cache_dir).read(filepath, start_date_limit)
+        else:
+            track = read_track(filepath, start_date_limit)
+    except Exception as e:
+        return None, f"Error reading file: {e}"
+    if track is None or track.start_time is None or len(track.lat) < 2:
+        return None, None
+    if geofilter is not None and not geofilter.matches(track.lat, track.lon, bbox=bbox):
+        return None, None
+
+    # Distance is measured on the full-resolution track, then sampled
+    # at the points that are drawn
+    _, cumulative = track_distances(track.lat, track.lon)
+    indices = interpolate_indices(len(track.lat), max_points)
+    points = np.column_stack((track.lat, track.lon))[indices]
+    return Course(index, track.start_time, points, cumulative[indices], float(cumulative[-1]), track.sport), None
+
+
+def _load_course_args(args):
+    return load_course(*args)
+
+
+def ingest_courses(files, start_date_limit=None, geofilter=None, max_points=120, workers=None,
+                   cache_dir=None, failed=None):
+    """
+    Load activities on a process pool.
+
+    Parsing is CPU-bound pure Python, so files are spread over worker
+    processes; results come back in the order of files, so colours and
+    cumulative drawing stay deterministic.
+
+    Args:
+        files: Sorted list of activity paths
+        workers: Number of processes (default: all cores, 1 = no pool)
+        cache_dir: Optional TrackCache folder shared by the workers,
+            pruned after the run (see TrackCache.prune)
+        failed: Optional list, extended with the files that could not be read
+
+    Returns:
+        list: Course for each kept activity, in file order
+    """
+    total = len(files)
+    workers = workers or os.cpu_count() or 1
+    jobs = [(i, f, start_date_limit, geofilter, max_points, cache_dir) for i, f in enumerate(files)]
+
+    if workers == 1 or total < 2:
+        results = map(_load_course_args, jobs)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, total))
+        results = executor.map(_load_course_args, jobs, chunksize=max(1, total // (workers * 4)))
+
+    courses = []
+    try:
+        for (i, f, *_), (course, error) in zip(jobs, results):
+            print(f"Processing {i+1}/{total}: {os.path.basename(f)}")
+            if error:
+                print(f"  {error}")
+                if failed is not None:
+                    failed.append(f)
+            if course is not None:
+                courses.append(course)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if cache_dir:
+        TrackCache(cache_dir).prune()
+    return courses